@@ -4,10 +4,13 @@
 from classes.zeekengine import ZeekEngine
 from classes.suricataengine import SuricataEngine
 from classes.report import Report
+from classes.timings import Timings
+from utils import submit_report
 from multiprocessing import Process, Manager
 import sys
 import re
 import json
+import time
 import os
 
 """
@@ -16,6 +19,69 @@ import os
     containing a capture.pcap file.
 """
 
+
+def zeekengine(capture_directory, alerts):
+    """
+        Run zeek against the capture and write the whitelisted
+        and non-whitelisted connections in the assets.
+    """
+    zeek = ZeekEngine(capture_directory)
+    zeek.start_zeek()
+    alerts["zeek"] = zeek.retrieve_alerts()
+    alerts["zeek_timings"] = zeek.timings.dump()
+
+    # whitelist.json writing.
+    with open(os.path.join(capture_directory, "assets/whitelist.json"), "w") as f:
+        f.write(json.dumps(zeek.retrieve_whitelist(),
+                           indent=4, separators=(',', ': ')))
+
+    # conns.json writing.
+    with open(os.path.join(capture_directory, "assets/conns.json"), "w") as f:
+        f.write(json.dumps(zeek.retrieve_conns(),
+                           indent=4, separators=(',', ': ')))
+
+
+def snortengine(capture_directory, alerts):
+    """
+        Run suricata against the capture.
+    """
+    suricata = SuricataEngine(capture_directory)
+    suricata.start_suricata()
+    alerts["suricata"] = suricata.get_alerts()
+    alerts["suricata_error"] = suricata.error
+    alerts["suricata_timings"] = suricata.timings.dump()
+
+
+def write_progress(capture_directory, stage, stages):
+    """
+        Write the current stage of the analysis in assets/progress.json,
+        followed by the frontend to push it to the clients.
+    """
+    stages.append({"stage": stage, "time": round(time.time(), 3)})
+    path = os.path.join(capture_directory, "assets/progress.json")
+    with open(path + ".tmp", "w") as f:
+        f.write(json.dumps({"stage": stage, "stages": stages}))
+    os.replace(path + ".tmp", path)
+
+
+def write_alerts(capture_directory, alerts):
+    """
+        Some formating and alerts.json writing.
+        :return: dict - the alerts sorted by level.
+    """
+    with open(os.path.join(capture_directory, "assets/alerts.json"), "w") as f:
+        report = {"high": [], "moderate": [], "low": []}
+        for alert in (alerts["zeek"] + alerts["suricata"]):
+            if alert["level"] == "High":
+                report["high"].append(alert)
+            if alert["level"] == "Moderate":
+                report["moderate"].append(alert)
+            if alert["level"] == "Low":
+                report["low"].append(alert)
+        f.write(json.dumps(report, indent=4, separators=(',', ': ')))
+        return report
+
+
 if __name__ == "__main__":
     if len(sys.argv) == 2:
         capture_directory = sys.argv[1]
@@ -23,54 +89,55 @@ if __name__ == "__main__":
 
             manager = Manager()
             alerts = manager.dict()
+            timings = Timings()
+            stages = []
+
+            try:
+                write_progress(capture_directory, "engines", stages)
+                with timings.stage("analysis.engines"):
+                    # Start the engines.
+                    p1 = Process(target=zeekengine, args=(capture_directory, alerts,))
+                    p2 = Process(target=snortengine, args=(capture_directory, alerts,))
+                    p1.start()
+                    p2.start()
+
+                    # Wait to their end.
+                    p1.join()
+                    p2.join()
+
+                # An engine which crashed left no (or partial) results.
+                if p1.exitcode != 0 or p2.exitcode != 0:
+                    raise Exception("Engine failed (zeek: {}, suricata: {})".format(p1.exitcode, p2.exitcode))
+
+                if alerts.get("suricata_error"):
+                    print(alerts["suricata_error"])
+
+                timings.merge(alerts.get("zeek_timings"))
+                timings.merge(alerts.get("suricata_timings"))
+
+                write_progress(capture_directory, "alerts", stages)
+                with timings.stage("analysis.alerts"):
+                    write_alerts(capture_directory, alerts)
+                timings.write(capture_directory)
+            except:
+                # No report will come, the clients stop waiting for it.
+                write_progress(capture_directory, "failed", stages)
+                raise
+            write_progress(capture_directory, "report", stages)
 
-            def zeekengine(alerts):
-                zeek = ZeekEngine(capture_directory)
-                zeek.start_zeek()
-                alerts["zeek"] = zeek.retrieve_alerts()
-
-                # whitelist.json writing.
-                with open(os.path.join(capture_directory, "assets/whitelist.json"), "w") as f:
-                    f.write(json.dumps(zeek.retrieve_whitelist(),
-                                       indent=4, separators=(',', ': ')))
-
-                # conns.json writing.
-                with open(os.path.join(capture_directory, "assets/conns.json"), "w") as f:
-                    f.write(json.dumps(zeek.retrieve_conns(),
-                                       indent=4, separators=(',', ': ')))
-
-            def snortengine(alerts):
-                suricata = SuricataEngine(capture_directory)
-                suricata.start_suricata()
-                alerts["suricata"] = suricata.get_alerts()
-
-            # Start the engines.
-            p1 = Process(target=zeekengine, args=(alerts,))
-            p2 = Process(target=snortengine, args=(alerts,))
-            p1.start()
-            p2.start()
-
-            # Wait to their end.
-            p1.join()
-            p2.join()
-
-            # Some formating and alerts.json writing.
-            with open(os.path.join(capture_directory, "assets/alerts.json"), "w") as f:
-                report = {"high": [], "moderate": [], "low": []}
-                for alert in (alerts["zeek"] + alerts["suricata"]):
-                    if alert["level"] == "High":
-                        report["high"].append(alert)
-                    if alert["level"] == "Moderate":
-                        report["moderate"].append(alert)
-                    if alert["level"] == "Low":
-                        report["low"].append(alert)
-                f.write(json.dumps(report, indent=4, separators=(',', ': ')))
-
-            # Generate the report
-            report = Report(capture_directory)
-            report_pdf = report.generate_report()
-            report.email_report(report_pdf)
-            print("Report generated and emailed")
+            # Hand over the PDF report to the renderer, the results
+            # above are already final. Render it here if not running.
+            if submit_report(capture_directory, email=True) is not None:
+                print("Report queued to the renderer")
+            else:
+                report = Report(capture_directory)
+                with timings.stage("report.render"):
+                    report_pdf = report.generate_report()
+                with timings.stage("report.email"):
+                    report.email_report(report_pdf)
+                timings.write(capture_directory)
+                print("Report generated and queued for email")
+            write_progress(capture_directory, "done", stages)
         else:
             print("The directory doesn't exist.")
     else:
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from analysis import zeekengine, snortengine, write_alerts
+from classes.report import Report
+from classes.timings import Timings
+from utils import load_indicators
+from multiprocessing import Pool, cpu_count
+import argparse
+import zipfile
+import shutil
+import json
+import time
+import csv
+import sys
+import os
+import re
+
+"""
+    This file allows to (re)analyse a batch of captures offline, for
+    example the archives saved on USB keys after an IOCs update. Each
+    input (pcap, zip archive or directory of them) gets its own output
+    directory and a summary of all the analyses is written at the end.
+
+    Usage: batch.py [-j JOBS] [-o OUTPUT] [--pdf] INPUT [INPUT ...]
+"""
+
+
+def list_inputs(paths):
+    """
+        List the captures to analyse from the given paths.
+        :return: list of pcap / zip files.
+    """
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for f in sorted(files):
+                    if f.lower().endswith((".pcap", ".pcapng", ".zip")):
+                        inputs.append(os.path.join(root, f))
+        elif os.path.isfile(path):
+            inputs.append(path)
+    return inputs
+
+
+def prepare(input_file, output_dir, name):
+    """
+        Create the capture directory expected by the engines from
+        a pcap file or a capture archive (see Save.save_capture).
+        :return: str - the capture directory.
+    """
+    capture_directory = os.path.join(output_dir, name)
+    os.makedirs(os.path.join(capture_directory, "assets"), exist_ok=True)
+
+    if zipfile.is_zipfile(input_file):
+        with zipfile.ZipFile(input_file) as z:
+            for member in ["capture.pcap", "assets/device.json", "assets/capinfos.json"]:
+                if member in z.namelist():
+                    with z.open(member) as src, open(os.path.join(capture_directory, member), "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+    else:
+        shutil.copyfile(input_file, os.path.join(
+            capture_directory, "capture.pcap"))
+    return capture_directory
+
+
+def process(job):
+    """
+        Analyse a single capture.
+        :return: dict - the analysis summary and its stages timings.
+    """
+    input_file, output_dir, name, pdf = job
+    timings, alerts = Timings(enabled=True), {}
+    result = {"input": input_file, "name": name, "status": False,
+              "high": 0, "moderate": 0, "low": 0, "error": ""}
+
+    with timings.stage("total"):
+        try:
+            with timings.stage("prepare"):
+                capture_directory = prepare(input_file, output_dir, name)
+
+            if not os.path.isfile(os.path.join(capture_directory, "capture.pcap")):
+                raise Exception("No capture.pcap found")
+
+            # The pool workers can't fork, so the engines run one after the other.
+            with timings.stage("zeek"):
+                zeekengine(capture_directory, alerts)
+            with timings.stage("suricata"):
+                snortengine(capture_directory, alerts)
+            if alerts["suricata_error"]:
+                raise Exception(alerts["suricata_error"])
+
+            report = write_alerts(capture_directory, alerts)
+            for level in ["high", "moderate", "low"]:
+                result[level] = len(report[level])
+
+            if pdf:
+                with timings.stage("report"):
+                    Report(capture_directory).generate_report()
+
+            result["status"] = True
+        except Exception as e:
+            result["error"] = str(e)
+
+    timings.merge(alerts.get("zeek_timings"))
+    timings.merge(alerts.get("suricata_timings"))
+    result["timings"] = {k: v["wall"] for k, v in timings.dump().items()}
+    result["max_rss"] = timings.dump()["total"]["max_rss"]
+    return result
+
+
+def write_summary(output_dir, results, duration):
+    """
+        Write the summary of the batch in JSON and CSV.
+        :return: dict - the summary.
+    """
+    stages = ["prepare", "zeek", "suricata", "report", "total"]
+    stages += sorted(set(k for r in results for k in r["timings"] if k not in stages))
+    summary = {"captures": len(results),
+               "succeeded": len([r for r in results if r["status"]]),
+               "duration": round(duration, 3),
+               "captures_per_minute": round(len(results) / duration * 60, 2) if duration else 0,
+               "stages": {},
+               "results": results}
+
+    for stage in stages:
+        values = [r["timings"][stage] for r in results if stage in r["timings"]]
+        if values:
+            summary["stages"][stage] = {"mean": round(sum(values) / len(values), 3),
+                                        "max": max(values),
+                                        "sum": round(sum(values), 3)}
+
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        f.write(json.dumps(summary, indent=4, separators=(',', ': ')))
+
+    with open(os.path.join(output_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["input", "name", "status", "high", "moderate", "low", "error"] + stages)
+        for r in results:
+            writer.writerow([r["input"], r["name"], r["status"], r["high"], r["moderate"], r["low"], r["error"]] +
+                            [r["timings"].get(stage, "") for stage in stages])
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse a batch of captures.")
+    parser.add_argument("inputs", nargs="+",
+                        help="pcap files, capture archives or directories")
+    parser.add_argument("-o", "--output", default="batch-output",
+                        help="output directory (default: batch-output)")
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count(),
+                        help="number of parallel analyses (default: number of cores)")
+    parser.add_argument("--pdf", action="store_true",
+                        help="generate the PDF report of each capture")
+    args = parser.parse_args()
+
+    inputs = list_inputs(args.inputs)
+    if not inputs:
+        print("No capture to analyse.")
+        sys.exit(1)
+
+    output_dir = os.path.abspath(args.output)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # One output directory per capture, with a safe and unique name.
+    jobs, names = [], set()
+    for input_file in inputs:
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.splitext(os.path.basename(input_file))[0])
+        unique, i = name, 1
+        while unique in names:
+            unique, i = "{}-{}".format(name, i), i + 1
+        names.add(unique)
+        jobs.append((os.path.abspath(input_file), output_dir, unique, args.pdf))
+
+    # Load the IOCs once, the pool workers inherit them.
+    load_indicators()
+
+    start = time.perf_counter()
+    results = []
+    with Pool(processes=max(1, args.jobs)) as pool:
+        for result in pool.imap_unordered(process, jobs):
+            results.append(result)
+            print("[{}/{}] {} - {}".format(len(results), len(jobs), result["name"],
+                                           "done in {}s".format(result["timings"]["total"]) if result["status"] else result["error"]))
+
+    summary = write_summary(output_dir, results, time.perf_counter() - start)
+    print("{} captures analysed in {}s ({} captures/min)".format(summary["captures"],
+                                                              summary["duration"],
+                                                              summary["captures_per_minute"]))
+    for stage, t in summary["stages"].items():
+        print("    {}: mean {}s, max {}s".format(stage, t["mean"], t["max"]))
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from classes.zeekengine import ZeekEngine
+from classes.parsezeeklogs import ParseZeekLogs
+from utils import use_database, load_indicators
+import subprocess as sp
+import importlib.util
+import statistics
+import platform
+import argparse
+import tempfile
+import sqlite3
+import shutil
+import random
+import json
+import time
+import sys
+import os
+
+"""
+    This file benchmarks the ZeekEngine checks against synthetic
+    Zeek logs and IOCs / whitelist databases, at several scales.
+    Everything runs offline: no zeek binary is needed and the active
+    analysis (DNS / whois lookups) is disabled.
+
+    Usage: benchmark.py [--flows 1000,10000] [--iocs 1000,10000] [-o results.json]
+"""
+
+STAGES = ["parse_conn_log", "load_iocs", "fill_dns", "netflow_check",
+          "ssl_check", "http_check", "files_check", "alerts_check"]
+
+LOGS = {
+    "conn": (["ts", "uid", "id.orig_h", "id.orig_p", "id.resp_h", "id.resp_p", "proto", "service"],
+             ["time", "string", "addr", "port", "addr", "port", "enum", "string"]),
+    "dns": (["ts", "uid", "query", "qtype_name", "answers"],
+            ["time", "string", "string", "string", "vector[string]"]),
+    "ssl": (["ts", "uid", "id.resp_h", "id.resp_p", "server_name", "issuer", "validation_status"],
+            ["time", "string", "addr", "port", "string", "string", "string"]),
+    "http": (["ts", "uid", "host"],
+             ["time", "string", "string"]),
+    "files": (["ts", "fuid", "tx_hosts", "rx_hosts", "mime_type", "filename", "sha1"],
+              ["time", "string", "set[addr]", "set[addr]", "string", "string", "string"]),
+}
+
+
+def random_ip(rnd):
+    return "{}.{}.{}.{}".format(rnd.randint(1, 223), rnd.randint(0, 255),
+                                rnd.randint(0, 255), rnd.randint(1, 254))
+
+
+def random_domain(rnd):
+    labels = ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randint(4, 10)))
+              for _ in range(rnd.randint(2, 3))]
+    return ".".join(labels) + rnd.choice([".com", ".net", ".org", ".io", ".xyz"])
+
+
+def write_log(directory, name, rows):
+    """
+        Write a Zeek log in its TSV format.
+    """
+    fields, types = LOGS[name]
+    with open(os.path.join(directory, "{}.log".format(name)), "w") as f:
+        f.write("#separator \\x09\n")
+        f.write("#set_separator\t,\n")
+        f.write("#empty_field\t(empty)\n")
+        f.write("#unset_field\t-\n")
+        f.write("#path\t{}\n".format(name))
+        f.write("#fields\t{}\n".format("\t".join(fields)))
+        f.write("#types\t{}\n".format("\t".join(types)))
+        for row in rows:
+            f.write("\t".join(str(v) for v in row) + "\n")
+        f.write("#close\t2021-01-01-00-00-00\n")
+
+
+def generate_logs(directory, nb_flows, rnd):
+    """
+        Generate the conn, dns, ssl, http and files logs of nb_flows flows.
+        :return: list of the (ip, domain) hosts used.
+    """
+    hosts = [(random_ip(rnd), random_domain(rnd)) for _ in range(max(1, nb_flows // 4))]
+    conn, dns, ssl, http, files = [], [], [], [], []
+
+    for ip, domain in hosts:
+        dns.append([time.time(), "C0", domain, "A", ip])
+
+    for i in range(nb_flows):
+        ip, domain = rnd.choice(hosts)
+        port = rnd.choice([443, 443, 443, 80, 8080, 5223, 4444])
+        proto = rnd.choice(["tcp", "tcp", "tcp", "udp"])
+        service = "http" if port in [80, 8080] else ("ssl" if port in [443, 5223] else "-")
+        conn.append([time.time(), "C{}".format(i), "192.168.100.2",
+                     rnd.randint(1025, 65535), ip, port, proto, service])
+        if service == "ssl":
+            ssl.append([time.time(), "C{}".format(i), ip, port, domain,
+                        rnd.choice(["CN=R3,O=Let's Encrypt,C=US", "CN=Some CA,O=Some,C=US"]),
+                        rnd.choice(["ok", "self signed certificate in certificate chain"])])
+        elif service == "http":
+            http.append([time.time(), "C{}".format(i), domain])
+        if i % 10 == 0:
+            files.append([time.time(), "F{}".format(i), ip, "192.168.100.2",
+                          "application/x-x509-user-cert", "-",
+                          "".join(rnd.choice("0123456789abcdef") for _ in range(40))])
+
+    for name, rows in [("conn", conn), ("dns", dns), ("ssl", ssl), ("http", http), ("files", files)]:
+        write_log(directory, name, rows)
+    return hosts
+
+
+def generate_database(path, nb_iocs, hosts, rnd):
+    """
+        Generate a database of nb_iocs IOCs (a few of them matching
+        the synthetic traffic) and a small whitelist, upgraded by the
+        backend migrations (which create its indexes).
+    """
+    parent = "/".join(sys.path[0].split("/")[:-1])
+    conn = sqlite3.connect(path)
+    with open(os.path.join(parent, "assets/scheme.sql"), "r") as f:
+        conn.executescript(f.read())
+
+    iocs, values = [], set()
+    for ip, domain in rnd.sample(hosts, min(len(hosts), max(1, nb_iocs // 100))):
+        iocs.append((rnd.choice([ip, domain]), "ip4addr" if rnd.random() < 0.5 else "domain"))
+    while len(iocs) < nb_iocs:
+        t = rnd.choice(["ip4addr", "domain", "domain", "cidr", "freedns", "tld", "sha1cert"])
+        if t == "ip4addr":
+            v = random_ip(rnd)
+        elif t == "cidr":
+            v = "{}/{}".format(random_ip(rnd), rnd.choice([16, 24]))
+        elif t == "tld":
+            v = "." + "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(4))
+        elif t == "sha1cert":
+            v = "".join(rnd.choice("0123456789abcdef") for _ in range(40))
+        else:
+            v = random_domain(rnd)
+        iocs.append((v, t))
+
+    rows = []
+    for v, t in iocs:
+        if v not in values:
+            values.add(v)
+            rows.append((v, t, "white", rnd.choice(["stalkerware", "tracker", "malicious"]), "benchmark", 0))
+    conn.executemany("INSERT INTO iocs (value, type, tlp, tag, source, added_on) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    whitelist = [(d, "domain") for _, d in rnd.sample(hosts, min(len(hosts), 10))]
+    whitelist.append(("10.0.0.0/8", "cidr"))
+    conn.executemany("INSERT OR IGNORE INTO whitelist (element, type, source, added_on) VALUES (?, ?, 'benchmark', 0)", whitelist)
+    conn.commit()
+    conn.close()
+
+    spec = importlib.util.spec_from_file_location(
+        "migrations", os.path.join(parent, "server/backend/app/db/migrations.py"))
+    migrations = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migrations)
+    migrations.upgrade(path)
+
+
+def run(directory, repeat):
+    """
+        Time each stage of the ZeekEngine on the generated logs.
+        :return: dict - the timings of each stage, in seconds.
+    """
+    timings = {stage: [] for stage in STAGES}
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for record in ParseZeekLogs(os.path.join(directory, "conn.log"), output_format="json", safe_headers=False):
+            pass
+        timings["parse_conn_log"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        load_indicators()
+        engine = ZeekEngine(directory)
+        engine.active_analysis = False
+        timings["load_iocs"].append(time.perf_counter() - t)
+
+        for stage in STAGES[2:]:
+            t = time.perf_counter()
+            if stage == "alerts_check":
+                engine.alerts_check()
+            else:
+                getattr(engine, stage)(directory)
+            timings[stage].append(time.perf_counter() - t)
+
+    return {stage: {"min": round(min(v), 6),
+                    "median": round(statistics.median(v), 6),
+                    "mean": round(statistics.mean(v), 6)} for stage, v in timings.items()}
+
+
+def git_revision():
+    try:
+        return sp.check_output(["git", "rev-parse", "HEAD"], cwd=sys.path[0],
+                               stderr=sp.DEVNULL).decode().strip()
+    except:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analysis engine.")
+    parser.add_argument("--flows", default="1000,10000",
+                        help="comma separated numbers of flows (default: 1000,10000)")
+    parser.add_argument("--iocs", default="1000,10000",
+                        help="comma separated numbers of IOCs (default: 1000,10000)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per scale (default: 3)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default="benchmark-results.json",
+                        help="results file (default: benchmark-results.json)")
+    args = parser.parse_args()
+
+    results = {"date": int(time.time()),
+               "revision": git_revision(),
+               "python": platform.python_version(),
+               "machine": platform.machine(),
+               "repeat": args.repeat,
+               "results": []}
+
+    for nb_flows in [int(n) for n in args.flows.split(",")]:
+        for nb_iocs in [int(n) for n in args.iocs.split(",")]:
+            rnd = random.Random(args.seed)
+            directory = tempfile.mkdtemp(prefix="tinycheck-bench-")
+            try:
+                hosts = generate_logs(directory, nb_flows, rnd)
+                generate_database(os.path.join(directory, "bench.sqlite3"), nb_iocs, hosts, rnd)
+                use_database(os.path.join(directory, "bench.sqlite3"))
+
+                stages = run(directory, args.repeat)
+                results["results"].append({"flows": nb_flows,
+                                           "iocs": nb_iocs,
+                                           "stages": stages})
+                print("{} flows / {} IOCs".format(nb_flows, nb_iocs))
+                for stage, t in stages.items():
+                    print("    {:<16} {:.4f}s".format(stage, t["median"]))
+            finally:
+                shutil.rmtree(directory)
+
+    with open(args.output, "w") as f:
+        f.write(json.dumps(results, indent=4, separators=(',', ': ')))
+    print("Results written in {}".format(args.output))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from utils import get_config
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import smtplib
+import sqlite3
+import ssl
+import sys
+import os
+import time
+
+
+class Mailer(object):
+    """
+        Persistent queue of the emails to be sent. The reports are
+        queued by the analysis and sent in batches by the renderer,
+        which reuses the same SMTP session while messages are pending.
+    """
+
+    def __init__(self, queue_path=None):
+        parent = "/".join(sys.path[0].split("/")[:-1])
+        self.queue_path = queue_path or os.path.join(
+            parent, "deliveries.sqlite3")
+        self.server = None
+
+        self.conn = sqlite3.connect(self.queue_path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS "deliveries" (
+                                "id"	INTEGER UNIQUE,
+                                "subject"	TEXT NOT NULL,
+                                "body"	TEXT NOT NULL,
+                                "filename"	TEXT NOT NULL,
+                                "attachment"	BLOB NOT NULL,
+                                "status"	TEXT NOT NULL DEFAULT 'pending',
+                                "attempts"	INTEGER NOT NULL DEFAULT 0,
+                                "next_try"	NUMERIC NOT NULL,
+                                "last_error"	TEXT,
+                                "added_on"	NUMERIC NOT NULL,
+                                PRIMARY KEY("id" AUTOINCREMENT))""")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        self.conn.close()
+
+    def enqueue(self, subject, body, filename, attachment):
+        """
+            Add an email to the delivery queue.
+            :return: int - id of the queued email.
+        """
+        now = int(time.time())
+        cur = self.conn.execute("""INSERT INTO deliveries (subject, body, filename, attachment, next_try, added_on)
+                                   VALUES (?, ?, ?, ?, ?, ?)""", (subject, body, filename, attachment, now, now))
+        self.conn.commit()
+        return cur.lastrowid
+
+    def next_try(self):
+        """
+            Get the time of the next delivery attempt.
+            :return: int - timestamp or None if the queue is empty.
+        """
+        res = self.conn.execute(
+            "SELECT MIN(next_try) FROM deliveries WHERE status = 'pending'").fetchone()
+        return res[0] if res is not None else None
+
+    def connect(self):
+        """
+            Open (or reuse) the SMTP session defined in the configuration.
+            :return: the SMTP session.
+        """
+        if self.server is not None:
+            try:
+                self.server.noop()
+                return self.server
+            except smtplib.SMTPException:
+                self.close()
+
+        host = get_config(("report", "smtp_server"))
+        port = get_config(("report", "smtp_port"))
+        timeout = get_config(("report", "smtp_timeout")) or 30
+
+        if get_config(("report", "smtp_ssl")):
+            self.server = smtplib.SMTP_SSL(host, port, timeout=timeout,
+                                           context=ssl.create_default_context())
+        else:
+            self.server = smtplib.SMTP(host, port, timeout=timeout)
+
+        if get_config(("report", "smtp_login")):
+            self.server.login(get_config(("report", "smtp_login")),
+                              get_config(("report", "smtp_password")))
+        return self.server
+
+    def close(self):
+        """
+            Close the SMTP session, if any.
+        """
+        try:
+            self.server.quit()
+        except:
+            pass
+        self.server = None
+
+    def build_message(self, subject, body, filename, attachment):
+        """
+            Build the email with its attached report.
+            :return: MIMEMultipart
+        """
+        message = MIMEMultipart()
+        message["From"] = get_config(("report", "sender"))
+        message["To"] = ", ".join(get_config(("report", "recipients")) or [])
+        message["Subject"] = subject
+        message.attach(MIMEText(body, "plain"))
+
+        part = MIMEBase("application", "octet-stream")
+        part.set_payload(attachment)
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition",
+                        "attachment; filename= {}".format(filename))
+        message.attach(part)
+        return message
+
+    def purge(self):
+        """
+            Delete the failed emails older than failed_retention
+            (and the sent ones kept by the previous versions).
+            :return: int - number of deleted emails.
+        """
+        retention = get_config(("report", "failed_retention")) or 604800
+        cur = self.conn.execute("""DELETE FROM deliveries WHERE status = 'sent'
+                                   OR (status = 'failed' AND added_on < ?)""", (int(time.time()) - retention,))
+        self.conn.commit()
+        return cur.rowcount
+
+    def drain(self):
+        """
+            Send the pending emails in batches through a single SMTP
+            session. Failed deliveries are retried later with an
+            exponential backoff, until max_attempts is reached. The
+            sent emails leave the queue, the failed ones are kept
+            for failed_retention seconds.
+            :return: int - number of sent emails.
+        """
+        batch_size = get_config(("report", "batch_size")) or 10
+        max_attempts = get_config(("report", "max_attempts")) or 8
+        retry_delay = get_config(("report", "retry_delay")) or 60
+        sender = get_config(("report", "sender"))
+        recipients = (get_config(("report", "recipients")) or []) + \
+                     (get_config(("report", "bcc")) or [])
+        sent = 0
+
+        while True:
+            batch = self.conn.execute("""SELECT id, subject, body, filename, attachment, attempts FROM deliveries
+                                         WHERE status = 'pending' AND next_try <= ?
+                                         ORDER BY next_try LIMIT ?""", (int(time.time()), batch_size)).fetchall()
+            if not batch:
+                break
+
+            for id, subject, body, filename, attachment, attempts in batch:
+                try:
+                    server = self.connect()
+                    message = self.build_message(subject, body, filename, attachment)
+                    server.sendmail(sender, recipients, message.as_string())
+                    self.conn.execute("DELETE FROM deliveries WHERE id = ?", (id,))
+                    sent += 1
+                except Exception as e:
+                    if isinstance(e, (OSError, smtplib.SMTPServerDisconnected)):
+                        self.close()
+                    attempts += 1
+                    status = "failed" if attempts >= max_attempts else "pending"
+                    delay = min(retry_delay * 2 ** (attempts - 1), 3600)
+                    self.conn.execute("UPDATE deliveries SET status = ?, attempts = ?, next_try = ?, last_error = ? WHERE id = ?",
+                                      (status, attempts, int(time.time()) + delay, str(e), id))
+                self.conn.commit()
+
+        self.purge()
+
+        # Keep the session open only while there is something to send.
+        if self.next_try() is None:
+            self.close()
+        return sent
@@ -1,21 +1,13 @@
-import weasyprint
 import os
 import json
 import hashlib
 import re
 import sys
 
-from weasyprint import HTML
 from pathlib import Path
 from datetime import datetime
 from utils import get_config
-
-import email, smtplib, ssl
-
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from classes.mailer import Mailer
 
 
 class Report(object):
@@ -32,11 +24,14 @@ class Report(object):
             capture_directory, "assets/device.json"))
         self.capinfos = self.read_json(os.path.join(
             capture_directory, "assets/capinfos.json"))
-        try:
-            with open(os.path.join(self.capture_directory, "capture.pcap"), "rb") as f:
-                self.capture_sha1 = hashlib.sha1(f.read()).hexdigest()
-        except:
-            self.capture_sha1 = "N/A"
+        # The SHA1 is computed by the frontend while capturing.
+        self.capture_sha1 = self.capinfos.get("SHA1") if isinstance(self.capinfos, dict) else None
+        if not self.capture_sha1:
+            try:
+                with open(os.path.join(self.capture_directory, "capture.pcap"), "rb") as f:
+                    self.capture_sha1 = hashlib.sha1(f.read()).hexdigest()
+            except:
+                self.capture_sha1 = "N/A"
 
         self.userlang = get_config(("frontend", "user_lang"))
 
@@ -54,10 +49,21 @@ class Report(object):
         with open(json_path, "r") as json_file:
             return json.load(json_file)
 
-    def generate_report(self):
+    def content_hash(self):
         """
-            Generate the full report in PDF
-            :return: generated pdf file
+            Hash the elements used to build the report, in order
+            to know if an already rendered PDF is still valid.
+            :return: str - sha256 hexdigest
+        """
+        content = json.dumps([self.alerts, self.whitelist, self.conns,
+                              self.device, self.capinfos, self.capture_sha1,
+                              self.userlang], sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def generate_html(self):
+        """
+            Generate the full report in HTML
+            :return: str
         """
         content = self.generate_page_header()
         content += self.generate_header()
@@ -66,61 +72,50 @@ class Report(object):
         content += self.generate_suspect_conns_block()
         content += self.generate_uncat_conns_block()
         content += self.generate_whitelist_block()
+        return content
+
+    def generate_report(self):
+        """
+            Generate the full report in PDF. If a PDF has already been
+            rendered from the same content, it is returned as is.
+            :return: generated pdf file
+        """
+        report_path = os.path.join(self.capture_directory, "report.pdf")
+        hash_path = os.path.join(self.capture_directory, "assets/report.sha256")
+        content_hash = self.content_hash()
+
+        if os.path.isfile(report_path) and os.path.isfile(hash_path):
+            with open(hash_path, "r") as f:
+                if f.read().strip() == content_hash:
+                    return report_path
 
-        htmldoc = HTML(string=content, base_url="").write_pdf()
-        Path(os.path.join(self.capture_directory,
-                          "report.pdf")).write_bytes(htmldoc)
-        return os.path.join(self.capture_directory, "report.pdf")
+        # WeasyPrint is heavy to import, only load it when needed.
+        from weasyprint import HTML
 
-    def email_report(self,report_file):
+        htmldoc = HTML(string=self.generate_html(), base_url="").write_pdf()
+        Path(report_path).write_bytes(htmldoc)
+        Path(hash_path).write_text(content_hash)
+        return report_path
+
+    def email_report(self, report_file):
         """
-        Email PDF report
+            Queue the PDF report for its delivery by email. The
+            emails are sent in background by the renderer.
+            :return: int - id of the queued email or None if disabled.
         """
-        
+        if not get_config(("report", "email")):
+            return None
+        if not get_config(("report", "recipients")) and not get_config(("report", "bcc")):
+            return None
+
         subject = "[**TEST MSG**] Tarkash-M Scan Report for " + str(self.device['name'])
-        body = "This contains an autogenerated scan report by a Tarkash-M Malware Scanner for device - "+str(self.device['name']) + " with MAC Address - "+str(self.device['mac_address'])		
-        sender_email = "mykhabar.news@gmail.com"
-        receiver_email = "wrickdevghosh@gmail.com"
-        password = "odjtvfqvxtkdjpxp"
-
-        # Create a multipart message and set headers
-        message = MIMEMultipart()
-        message["From"] = sender_email
-        message["To"] = receiver_email
-        message["Subject"] = subject
-        message["Bcc"] = "deepak.singh000@gmail.com"  # Recommended for mass emails
-
-        # Add body to email
-        message.attach(MIMEText(body, "plain"))
-
-        filename = report_file
-        
-        # Open PDF file in binary mode
-        with open(filename, "rb") as attachment:
-        	# Add file as application/octet-stream
-        	# Email client can usually download this automatically as attachment
-            part = MIMEBase("application", "octet-stream")
-            part.set_payload(attachment.read())
-        
-        # Encode file in ASCII characters to send by email    
-        encoders.encode_base64(part)
-        
-        # Add header as key/value pair to attachment part
-        part.add_header(
-        "Content-Disposition",
-        f"attachment; filename= {filename}",
-        )
-        
-        # Add attachment to message and convert message to string
-        message.attach(part)
-        text = message.as_string()
-        
-        # Log in to server using secure context and send email
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-            server.login(sender_email, password)
-            server.sendmail(sender_email, receiver_email, text)
-    
+        body = "This contains an autogenerated scan report by a Tarkash-M Malware Scanner for device - "+str(self.device['name']) + " with MAC Address - "+str(self.device['mac_address'])
+
+        with open(report_file, "rb") as attachment, Mailer() as mailer:
+            return mailer.enqueue(subject, body,
+                                  os.path.basename(report_file),
+                                  attachment.read())
+
     def generate_warning(self):
         """
             Generate the warning message.
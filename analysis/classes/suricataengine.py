@@ -2,8 +2,11 @@
 # -*- coding: utf-8 -*-
 
 from utils import get_iocs, get_apname, get_device, get_config
+from classes.timings import Timings
 import time
 import os
+import shutil
+import tempfile
 import subprocess as sp
 import re
 import json
@@ -16,7 +19,11 @@ class SuricataEngine():
 
         self.wdir = capture_directory
         self.alerts = []
-        self.rules_file = "/tmp/rules.rules"
+        self.error = None
+        self.timings = Timings()
+        # Per analysis directory, so several analyses can run at once.
+        self.log_dir = tempfile.mkdtemp(prefix="suricata-")
+        self.rules_file = os.path.join(self.log_dir, "rules.rules")
         self.pcap_path = os.path.join(self.wdir, "capture.pcap")
         self.rules = [r[0] for r in get_iocs(
             "snort")] + self.generate_contextual_alerts()
@@ -31,27 +38,42 @@ class SuricataEngine():
 
     def start_suricata(self):
         """
-            Launch suricata against the capture.pcap file.
+            Launch suricata against the capture.pcap file. If it
+            can't run or doesn't write its log, the error is kept
+            in self.error.
             :return: nothing.
         """
 
         # Generate the rule file an launch suricata.
-        if self.generate_rule_file():
-            sp.Popen(["suricata", "-S", self.rules_file, "-r",
-                      self.pcap_path, "-l", "/tmp/"]).wait()
+        with self.timings.stage("suricata.run"):
+            if self.generate_rule_file():
+                try:
+                    returncode = sp.Popen(["suricata", "-S", self.rules_file, "-r",
+                                           self.pcap_path, "-l", self.log_dir]).wait()
+                    if returncode != 0:
+                        self.error = "Suricata exited with code {}".format(returncode)
+                except OSError as e:
+                    self.error = "Suricata can't be launched: {}".format(e)
+            else:
+                self.error = "The rules file can't be written"
 
         # Let's parse the log file.
-        for line in open("/tmp/fast.log", "r").readlines():
-            if "[**]" in line:
-                s = line.split("[**]")[1].strip()
-                m = re.search(
-                    r"\[\d+\:(?P<sid>\d+)\:(?P<rev>\d+)\] (?P<title>[ -~]+)", s)
-                self.alerts.append({"title": self.template["SNORT-01"]["title"].format(m.group('title')),
-                                    "description": self.template["SNORT-01"]["description"],
-                                    "level": "High",
-                                    "id": "SNORT-01"})
-        # Remove fast.log
-        os.remove("/tmp/fast.log")
+        with self.timings.stage("suricata.parse"):
+            try:
+                with open(os.path.join(self.log_dir, "fast.log"), "r") as f:
+                    for line in f:
+                        if "[**]" in line:
+                            s = line.split("[**]")[1].strip()
+                            m = re.search(
+                                r"\[\d+\:(?P<sid>\d+)\:(?P<rev>\d+)\] (?P<title>[ -~]+)", s)
+                            self.alerts.append({"title": self.template["SNORT-01"]["title"].format(m.group('title')),
+                                                "description": self.template["SNORT-01"]["description"],
+                                                "level": "High",
+                                                "id": "SNORT-01"})
+            except OSError as e:
+                self.error = self.error or "Suricata log can't be read: {}".format(e)
+        # Remove fast.log and the other suricata files.
+        shutil.rmtree(self.log_dir, ignore_errors=True)
 
     def generate_rule_file(self):
         """
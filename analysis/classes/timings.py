@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from utils import get_config
+from contextlib import nullcontext
+import resource
+import json
+import time
+import os
+
+# Returned by Timings.stage() when the timings are disabled.
+NOTHING = nullcontext()
+
+
+class Stage(object):
+    """
+        Context manager measuring a single stage: wall time, CPU time
+        of the process and of its subprocesses, and peak RSS.
+    """
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.children_cpu = children.ru_utime + children.ru_stime
+        return self
+
+    def __exit__(self, *exc):
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.stages[self.name] = {
+            "wall": round(time.perf_counter() - self.wall, 4),
+            "cpu": round(time.process_time() - self.cpu, 4),
+            "children_cpu": round(children.ru_utime + children.ru_stime - self.children_cpu, 4),
+            "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "children_max_rss": children.ru_maxrss}
+        return False
+
+
+class Timings(object):
+    """
+        Collect the timings of the analysis stages. When disabled
+        in the configuration (analysis/timings), stage() costs a
+        single attribute check.
+    """
+
+    def __init__(self, enabled=None):
+        self.enabled = get_config(("analysis", "timings")) if enabled is None else enabled
+        self.stages = {}
+
+    def stage(self, name):
+        """
+            Measure the stage wrapped by the with statement.
+            :return: context manager.
+        """
+        return Stage(self.stages, name) if self.enabled else NOTHING
+
+    def merge(self, stages):
+        """
+            Add stages measured elsewhere (eg. in another process).
+        """
+        if self.enabled and stages:
+            self.stages.update(stages)
+
+    def dump(self):
+        """
+            Get the measured stages.
+            :return: dict
+        """
+        return dict(self.stages)
+
+    def write(self, capture_directory):
+        """
+            Write the stages in assets/timings.json, merged with
+            the stages already written by other processes.
+            :return: bool - True if written.
+        """
+        if not self.enabled:
+            return False
+
+        path = os.path.join(capture_directory, "assets/timings.json")
+        stages = {}
+        try:
+            with open(path, "r") as f:
+                stages = json.load(f)
+        except:
+            pass
+        stages.update(self.stages)
+
+        with open(path + ".tmp", "w") as f:
+            f.write(json.dumps(stages, indent=4, separators=(',', ': ')))
+        os.replace(path + ".tmp", path)
+        return True
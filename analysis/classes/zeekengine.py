@@ -3,6 +3,7 @@
 # -*- coding: utf-8 -*-
 
 from classes.parsezeeklogs import ParseZeekLogs
+from classes.timings import Timings
 from netaddr import IPNetwork, IPAddress
 from utils import get_iocs, get_config, get_whitelist
 from datetime import datetime
@@ -26,6 +27,7 @@ class ZeekEngine(object):
         self.dns = []
         self.files = []
         self.whitelist = []
+        self.timings = Timings()
 
         # Get analysis and userlang configuration
         self.heuristics_analysis = get_config(("analysis", "heuristics"))
@@ -219,6 +221,14 @@ class ZeekEngine(object):
                                             "host": c["resolution"],
                                             "level": "Low",
                                             "id": "IOC-06"})
+
+    def active_check(self):
+        """
+            Check the non-whitelisted domains with active lookups:
+                * Blacklisted nameservers.
+                * Recently registered domains (whois).
+            :return: nothing - all stuff appended to self.alerts
+        """
         if self.active_analysis:
             for c in self.conns:
                 try:  # Domain nameservers check.
@@ -443,17 +453,26 @@ class ZeekEngine(object):
         """
             Start zeek and check the logs.
         """
-        sp.Popen("cd {} && /opt/zeek/bin/zeek -Cr capture.pcap protocols/ssl/validate-certs".format(
-            self.working_dir), shell=True).wait()
-        sp.Popen("cd {} && mv *.log assets/".format(self.working_dir),
-                 shell=True).wait()
-
-        self.fill_dns(self.working_dir + "/assets/")
-        self.netflow_check(self.working_dir + "/assets/")
-        self.ssl_check(self.working_dir + "/assets/")
-        self.http_check(self.working_dir + "/assets/")
-        self.files_check(self.working_dir + "/assets/")
-        self.alerts_check()
+        with self.timings.stage("zeek.run"):
+            sp.Popen("cd {} && /opt/zeek/bin/zeek -Cr capture.pcap protocols/ssl/validate-certs".format(
+                self.working_dir), shell=True).wait()
+            sp.Popen("cd {} && mv *.log assets/".format(self.working_dir),
+                     shell=True).wait()
+
+        with self.timings.stage("zeek.fill_dns"):
+            self.fill_dns(self.working_dir + "/assets/")
+        with self.timings.stage("zeek.netflow_check"):
+            self.netflow_check(self.working_dir + "/assets/")
+        with self.timings.stage("zeek.active_check"):
+            self.active_check()
+        with self.timings.stage("zeek.ssl_check"):
+            self.ssl_check(self.working_dir + "/assets/")
+        with self.timings.stage("zeek.http_check"):
+            self.http_check(self.working_dir + "/assets/")
+        with self.timings.stage("zeek.files_check"):
+            self.files_check(self.working_dir + "/assets/")
+        with self.timings.stage("zeek.alerts_check"):
+            self.alerts_check()
 
     def retrieve_alerts(self):
         """
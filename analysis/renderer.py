@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from classes.report import Report
+from classes.mailer import Mailer
+from classes.timings import Timings
+from utils import get_config
+from multiprocessing.connection import Listener
+from threading import Thread, Event, Lock
+from queue import Queue
+import json
+import time
+import os
+
+"""
+    This file runs the persistent report renderer. WeasyPrint
+    is loaded once at startup and the PDF reports are rendered
+    from a queue, either in the background once the analysis
+    results are published or on demand by the frontend. It also
+    sends the queued emails in background.
+"""
+
+jobs = Queue()
+emails = Event()
+
+# Jobs submitted by polling clients, by capture directory, kept
+# until the client polling after the rendering gets its result.
+polled = {}
+polled_lock = Lock()
+
+
+def render(capture_directory, email):
+    """
+        Render the PDF report of a capture (cached by content hash
+        by the Report class) and email it if asked.
+        :return: dict - status of the rendering.
+    """
+    try:
+        timings = Timings()
+        report = Report(capture_directory)
+        with timings.stage("report.render"):
+            report_pdf = report.generate_report()
+        if email:
+            with timings.stage("report.email"):
+                if report.email_report(report_pdf) is not None:
+                    emails.set()
+        timings.write(capture_directory)
+        return {"status": True,
+                "message": "Report generated",
+                "report": report_pdf}
+    except:
+        return {"status": False,
+                "message": "Error while generating the report"}
+
+
+def renderer():
+    """
+        Process the queued jobs one by one.
+    """
+    while True:
+        job = jobs.get()
+        job["result"] = render(job["capture_directory"], job["email"])
+        job["done"].set()
+
+
+def sender():
+    """
+        Send the queued emails, then wait for new ones
+        or for the next retry.
+    """
+    mailer = Mailer()
+    while True:
+        # Retry soon if the queue can't be read (e.g. locked by the analysis).
+        timeout = 10
+        try:
+            mailer.drain()
+            next_try = mailer.next_try()
+            timeout = max(1, next_try - time.time()) if next_try is not None else None
+        except:
+            pass
+        emails.wait(timeout)
+        emails.clear()
+
+
+def poll(capture_directory):
+    """
+        Get the result of the job of a polling client, queueing
+        the job if there is none for this capture yet.
+        :return: dict - result of the job or rendering status.
+    """
+    with polled_lock:
+        job = polled.get(capture_directory)
+        if job is None:
+            job = {"capture_directory": capture_directory,
+                   "email": False,
+                   "done": Event()}
+            polled[capture_directory] = job
+            jobs.put(job)
+        elif job["done"].is_set():
+            return polled.pop(capture_directory)["result"]
+    return {"status": True,
+            "message": "Report rendering",
+            "rendering": True}
+
+
+def handle(conn):
+    """
+        Queue the job submitted by a client and answer it,
+        once rendered if the client asked to wait for it. A
+        polling client is answered right away, with the result
+        once rendered or with a "rendering" status meanwhile.
+    """
+    try:
+        request = json.loads(conn.recv_bytes().decode())
+        if not os.path.isdir(request["capture_directory"]):
+            conn.send_bytes(json.dumps({"status": False,
+                                        "message": "The directory doesn't exist."}).encode())
+            return
+
+        if request.get("poll"):
+            conn.send_bytes(json.dumps(poll(request["capture_directory"])).encode())
+            return
+
+        job = {"capture_directory": request["capture_directory"],
+               "email": bool(request.get("email")),
+               "done": Event()}
+        jobs.put(job)
+
+        if request.get("wait"):
+            job["done"].wait()
+            conn.send_bytes(json.dumps(job["result"]).encode())
+        else:
+            conn.send_bytes(json.dumps({"status": True,
+                                        "message": "Report queued"}).encode())
+    except:
+        pass
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+
+    # Warm up WeasyPrint (imports, fonts) before accepting jobs.
+    from weasyprint import HTML
+    HTML(string="<p>TinyCheck</p>").write_pdf()
+
+    socket = get_config(("analysis", "renderer_socket"))
+    if os.path.exists(socket):
+        os.remove(socket)
+
+    listener = Listener(socket, family="AF_UNIX")
+    os.chmod(socket, 0o600)
+
+    Thread(target=renderer, daemon=True).start()
+    Thread(target=sender, daemon=True).start()
+
+    while True:
+        try:
+            conn = listener.accept()
+            Thread(target=handle, args=(conn,), daemon=True).start()
+        except:
+            continue
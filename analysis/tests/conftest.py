@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import tempfile
+import pytest
+import shutil
+import sys
+import os
+
+"""
+    The analysis finds config.yaml one level above sys.path[0]
+    (/usr/share/tinycheck/analysis) and imports its modules from
+    there. It is pointed to a temporary install holding a copy of
+    the configuration, as pytest puts the test directories first
+    in sys.path.
+"""
+
+analysis = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+root = os.path.dirname(analysis)
+
+install = tempfile.mkdtemp(prefix="tinycheck-tests-")
+os.makedirs(os.path.join(install, "analysis"))
+shutil.copy(os.path.join(root, "config.yaml"), install)
+
+sys.path[0:0] = [os.path.join(install, "analysis"), analysis]
+import utils
+
+
+@pytest.fixture(autouse=True)
+def tinycheck_install(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.join(install, "analysis"))
+    return install
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(install, ignore_errors=True)
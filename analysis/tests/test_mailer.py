@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+from classes.mailer import Mailer
+from unittest import mock
+import threading
+import tempfile
+import unittest
+import shutil
+import time
+import os
+
+"""
+    Tests of the delivery of the queued emails, against a local
+    SMTP server refusing the messages on demand.
+"""
+
+
+class SMTPHandler(StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        self.reply("220 localhost SMTP")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line.split(" ", 1)[0].upper()
+            if not line or command == "QUIT":
+                self.reply("221 Bye")
+                break
+            elif command in ["EHLO", "HELO", "NOOP", "RSET", "RCPT"]:
+                self.reply("250 OK")
+            elif command == "MAIL":
+                if server.refuse:
+                    self.reply("451 Try again later")
+                else:
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    line = self.rfile.readline().decode()
+                    if line in [".\r\n", ""]:
+                        break
+                    data.append(line)
+                server.messages.append("".join(data))
+                self.reply("250 OK")
+            else:
+                self.reply("502 Not implemented")
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+
+class SMTPServer(ThreadingTCPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.messages = []
+        self.refuse = False
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class TestDrain(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SMTPServer()
+        self.dir = tempfile.mkdtemp()
+        self.config = {"smtp_server": "127.0.0.1",
+                       "smtp_port": self.server.server_address[1],
+                       "smtp_ssl": False,
+                       "sender": "tinycheck@localhost",
+                       "recipients": ["user@localhost"],
+                       "bcc": [],
+                       "max_attempts": 2,
+                       "retry_delay": 60,
+                       "failed_retention": 3600}
+        patch = mock.patch("classes.mailer.get_config",
+                           lambda path: self.config.get(path[1]) if path[0] == "report" else None)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.mailer = Mailer(os.path.join(self.dir, "deliveries.sqlite3"))
+
+    def tearDown(self):
+        self.mailer.close()
+        self.mailer.conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def deliveries(self):
+        return self.mailer.conn.execute("SELECT status, attempts, next_try, added_on FROM deliveries").fetchall()
+
+    def test_send(self):
+        for i in range(3):
+            self.mailer.enqueue("Report {}".format(i), "Body", "report.pdf", b"%PDF-1.4")
+        self.assertEqual(self.mailer.drain(), 3)
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertIn("Subject: Report 0", self.server.messages[0])
+
+        # The sent emails (and their reports) leave the queue.
+        self.assertEqual(self.deliveries(), [])
+        self.assertIsNone(self.mailer.next_try())
+
+    def test_retry(self):
+        self.server.refuse = True
+        self.mailer.enqueue("Report", "Body", "report.pdf", b"%PDF-1.4")
+        start = int(time.time())
+        self.assertEqual(self.mailer.drain(), 0)
+        status, attempts, next_try, _ = self.deliveries()[0]
+        self.assertEqual((status, attempts), ("pending", 1))
+        self.assertTrue(start + 60 <= next_try <= int(time.time()) + 60)
+
+        # Not due yet: nothing is sent.
+        self.server.refuse = False
+        self.assertEqual(self.mailer.drain(), 0)
+        self.assertEqual(self.server.messages, [])
+
+        self.mailer.conn.execute("UPDATE deliveries SET next_try = 0")
+        self.assertEqual(self.mailer.drain(), 1)
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(self.deliveries(), [])
+
+    def test_failed(self):
+        self.server.refuse = True
+        self.mailer.enqueue("Report", "Body", "report.pdf", b"%PDF-1.4")
+        self.mailer.drain()
+        self.mailer.conn.execute("UPDATE deliveries SET next_try = 0")
+        start = int(time.time())
+        self.mailer.drain()
+
+        # The backoff doubles, then max_attempts is reached.
+        status, attempts, next_try, _ = self.deliveries()[0]
+        self.assertEqual((status, attempts), ("failed", 2))
+        self.assertTrue(start + 120 <= next_try <= int(time.time()) + 120)
+        self.assertIsNone(self.mailer.next_try())
+
+        # Kept for failed_retention, then purged.
+        self.assertEqual(self.mailer.purge(), 0)
+        self.mailer.conn.execute("UPDATE deliveries SET added_on = ?", (int(time.time()) - 3601,))
+        self.assertEqual(self.mailer.purge(), 1)
+        self.assertEqual(self.deliveries(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
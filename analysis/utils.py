@@ -8,11 +8,68 @@ import sys
 import json
 import os
 from functools import reduce
+from urllib.parse import quote
+from multiprocessing.connection import Client
+
+
+def connect(path):
+    """
+        Open a read-only connection to the database. The database
+        being in WAL mode (set by the backend), the analysis never
+        waits for the watchers writes.
+        :return: sqlite3 connection
+    """
+    conn = sqlite3.connect("file:{}?mode=ro".format(quote(path)), uri=True)
+    conn.execute("PRAGMA cache_size = -8000")
+    conn.execute("PRAGMA mmap_size = 67108864")
+    return conn
+
 
 # I'm not going to use an ORM for that.
 parent = "/".join(sys.path[0].split("/")[:-1])
-conn = sqlite3.connect(os.path.join(parent, "tinycheck.sqlite3"))
-cursor = conn.cursor()
+database = os.path.join(parent, "tinycheck.sqlite3")
+cursor = None
+
+
+def get_cursor():
+    """
+        Get the cursor of the database, connecting on first use.
+        :return: sqlite3 cursor
+    """
+    global cursor
+    if cursor is None:
+        cursor = connect(database).cursor()
+    return cursor
+
+# IOCs and whitelisted elements by type, once loaded by load_indicators().
+# The processes forked afterwards share them instead of querying the DB.
+indicators = {}
+
+
+def load_indicators():
+    """
+        Load all the IOCs and whitelisted elements in memory.
+        :return: nothing - the indicators dict is filled.
+    """
+    iocs, whitelist = {}, {}
+    get_cursor().execute("SELECT type, value, tag FROM iocs ORDER BY value")
+    for r in get_cursor().fetchall():
+        iocs.setdefault(r[0], []).append((r[1], r[2]))
+    get_cursor().execute("SELECT type, element FROM whitelist ORDER BY element")
+    for r in get_cursor().fetchall():
+        whitelist.setdefault(r[0], []).append(r[1])
+    indicators["iocs"] = iocs
+    indicators["whitelist"] = whitelist
+
+
+def use_database(path):
+    """
+        Use another database than tinycheck.sqlite3 (eg. benchmarks).
+        :return: nothing - the module connection is replaced.
+    """
+    global database, cursor
+    database, cursor = path, None
+    indicators.clear()
 
 
 def get_iocs(ioc_type):
@@ -20,9 +77,11 @@ def get_iocs(ioc_type):
         Get a list of IOCs specified by their type.
         :return: list of IOCs
     """
-    cursor.execute(
+    if "iocs" in indicators:
+        return [[r[0], r[1]] for r in indicators["iocs"].get(ioc_type, [])]
+    get_cursor().execute(
         "SELECT value, tag FROM iocs WHERE type = ? ORDER BY value", (ioc_type,))
-    res = cursor.fetchall()
+    res = get_cursor().fetchall()
     return [[r[0], r[1]] for r in res] if res is not None else []
 
 
@@ -31,9 +90,11 @@ def get_whitelist(elem_type):
         Get a list of whitelisted elements specified by their type.
         :return: list of elements
     """
-    cursor.execute(
+    if "whitelist" in indicators:
+        return list(indicators["whitelist"].get(elem_type, []))
+    get_cursor().execute(
         "SELECT element FROM whitelist WHERE type = ? ORDER BY element", (elem_type,))
-    res = cursor.fetchall()
+    res = get_cursor().fetchall()
     return [r[0] for r in res] if res is not None else []
 
 
@@ -72,3 +133,25 @@ def get_apname():
                     return l.replace("ssid=", "").strip()
     except:
         pass
+
+
+def submit_report(capture_directory, email=False, wait=False):
+    """
+        Submit a capture directory to the report renderer.
+        If wait is False, the function returns as soon as the
+        job is queued by the renderer.
+        :return: dict - the renderer answer or None if not reachable.
+    """
+    try:
+        conn = Client(get_config(("analysis", "renderer_socket")), family="AF_UNIX")
+    except:
+        return None
+    try:
+        conn.send_bytes(json.dumps({"capture_directory": capture_directory,
+                                    "email": email,
+                                    "wait": wait}).encode())
+        return json.loads(conn.recv_bytes().decode())
+    except:
+        return None
+    finally:
+        conn.close()
@@ -28,3 +28,12 @@ CREATE TABLE "misp" (
 	"last_sync" NUMERIC NOT NULL DEFAULT 0,
 	PRIMARY KEY("id" AUTOINCREMENT)
 );
+
+CREATE TABLE "feeds" (
+	"id"	INTEGER,
+	"url"	TEXT NOT NULL UNIQUE,
+	"etag"	TEXT,
+	"last_modified"	TEXT,
+	"last_sync"	INTEGER,
+	PRIMARY KEY("id" AUTOINCREMENT)
+);
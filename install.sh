@@ -157,6 +157,7 @@ Description=Tarkash backend service
 [Service]
 Type=simple
 ExecStart=/usr/bin/python3 /usr/share/tinycheck/server/backend/main.py
+ExecReload=/bin/kill -HUP \$MAINPID
 Restart=on-abort
 KillMode=process
 
@@ -194,7 +195,22 @@ After=network-online.target
 [Service]
 Type=simple
 ExecStart=/usr/bin/python3 /usr/share/tinycheck/server/backend/watchers.py
-Restart=on-abort
+Restart=on-failure
+KillMode=process
+
+[Install]
+WantedBy=multi-user.target
+EOL
+
+    echo -e "\e[92m    [✔] Creating renderer service\e[39m"
+    cat >/lib/systemd/system/tinycheck-renderer.service <<EOL
+[Unit]
+Description=Tarkash report renderer service
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 /usr/share/tinycheck/analysis/renderer.py
+Restart=on-failure
 KillMode=process
 
 [Install]
@@ -206,6 +222,7 @@ EOL
    systemctl enable tinycheck-backend &> /dev/null
    systemctl enable tinycheck-kiosk &> /dev/null
    systemctl enable tinycheck-watchers &> /dev/null
+   systemctl enable tinycheck-renderer &> /dev/null
 }
 
 configure_dnsmask() {
@@ -4,7 +4,6 @@
 from flask import Blueprint, request, jsonify, send_file
 from app.decorators import *
 from app.classes.config import Config
-import sys
 
 config_bp = Blueprint("config", __name__)
 config = Config()
@@ -48,26 +47,25 @@ def edit(cat, key, value):
 @require_get_token
 def export_db():
     """
-        Export the database.
+        Export the database, compressed if the compression
+        parameter is given (gzip or zstd).
         :return: current database as attachment
     """
-    return config.export_db()
+    res = config.export_db(request.args.get("compression"))
+    return jsonify(res) if isinstance(res, dict) else res
 
 
 @config_bp.route('/db/import', methods=['POST'])
 @require_header_token
 def import_db():
     """
-        Import a database and replace the existant.
+        Import a database and replace the existant, or merge its
+        IOCs and whitelisted elements (mode=merge).
         :return: status in JSON
     """
     try:
-        f = request.files["file"]
-        assert f.read(15) == b"SQLite format 3"
-        d = "/".join(sys.path[0].split("/")[:-2])
-        f.save("/{}/tinycheck.sqlite3".format(d))
-        res = {"status": True,
-               "message": "Database updated"}
+        merge = request.form.get("mode") == "merge"
+        res = config.import_db(request.files["file"].stream, merge)
     except:
         res = {"status": False,
                "message": "Error while database upload"}
@@ -82,4 +80,6 @@ def list():
     """
     res = config.export_config()
     res["backend"]["password"] = ""
+    if "report" in res:
+        res["report"]["smtp_password"] = ""
     return jsonify(res)
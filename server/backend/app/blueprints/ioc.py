@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Blueprint, jsonify, Response, request
+from flask import Blueprint, jsonify, Response, request, stream_with_context
 from app.decorators import require_header_token, require_get_token
 from app.classes.iocs import IOCs
+from app.db.search import SEARCH_LIMIT
+from app.utils import page_args, stream_export
 
 import json
 from urllib.parse import unquote
@@ -40,6 +42,20 @@ def add_post():
     return jsonify(res)
 
 
+@ioc_bp.route('/add_bulk', methods=['POST'])
+@require_header_token
+def add_bulk():
+    """
+        Parse and add a batch of IOCs to the database. The IOCs are
+        in the export format: {"iocs": [{"type", "tag", "tlp", "value"}]}
+        :return: status of the operation in JSON
+    """
+    data = json.loads(request.data)
+    source = data.get("source", "backend")
+    res = IOCs.add_many(data.get("iocs", []), source)
+    return jsonify(res)
+
+
 @ioc_bp.route('/delete/<ioc_id>', methods=['GET'])
 @require_header_token
 def delete(ioc_id):
@@ -55,11 +71,27 @@ def delete(ioc_id):
 @require_header_token
 def search(term):
     """
-        Search IOCs in the database.
+        Search IOCs in the database. Pass after_id (0 for the first
+        page) and limit to page through all the results.
         :return: potential results in JSON.
     """
-    res = IOCs.search(term)
-    return jsonify({"results": [i for i in res]})
+    after_id, limit = page_args(request.args, SEARCH_LIMIT)
+    res = [i for i in IOCs.search(term, after_id, limit)]
+    next_after_id = res[-1]["id"] if after_id is not None and len(res) == limit else None
+    return jsonify({"results": res, "next_after_id": next_after_id})
+
+
+@ioc_bp.route('/list', methods=['GET'])
+@require_header_token
+def get_page():
+    """
+        List the IOCs by pages, after the id after_id.
+        :return: a page of IOCs in JSON.
+    """
+    after_id, limit = page_args(request.args, SEARCH_LIMIT)
+    res = [i for i in IOCs.get_page(after_id or 0, limit)]
+    next_after_id = res[-1]["id"] if len(res) == limit else None
+    return jsonify({"results": res, "next_after_id": next_after_id})
 
 
 @ioc_bp.route('/get/types')
@@ -88,10 +120,13 @@ def get_tags():
 @require_get_token
 def get_all():
     """
-        Retreive a list of all IOCs.
+        Retreive a list of all IOCs, streamed in JSON or
+        in NDJSON (format=ndjson).
         :return: list of iocs in JSON.
     """
-    res = IOCs.get_all()
-    return Response(json.dumps({"iocs": [i for i in res]}),
-                    mimetype='application/json',
-                    headers={'Content-Disposition': 'attachment;filename=iocs-export.json'})
+    ndjson = request.args.get("format") == "ndjson"
+    res = stream_export("iocs", IOCs.get_all(), ndjson)
+    return Response(stream_with_context(res),
+                    mimetype='application/x-ndjson' if ndjson else 'application/json',
+                    headers={'Content-Disposition': 'attachment;filename=iocs-export.{}'.format(
+                        "ndjson" if ndjson else "json")})
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from flask import Blueprint, jsonify
+from app.decorators import require_header_token
+from app.classes.feeds import Feeds
+
+watchers_bp = Blueprint("watchers", __name__)
+
+
+@watchers_bp.route('/status', methods=['GET'])
+@require_header_token
+def get_status():
+    """
+        Retrieve the state of the feeds polled by the watchers:
+        last success, duration, items and bytes of each feed.
+        :return: state of the feeds in JSON.
+    """
+    res = Feeds.get_status()
+    return jsonify(res)
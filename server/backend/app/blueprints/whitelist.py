@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Blueprint, jsonify, Response
+from flask import Blueprint, jsonify, Response, request, stream_with_context
 from app.decorators import require_header_token, require_get_token
 from app.classes.whitelist import WhiteList
+from app.db.search import SEARCH_LIMIT
+from app.utils import page_args, stream_export
 import json
 
 whitelist_bp = Blueprint("whitelist", __name__)
@@ -22,6 +24,20 @@ def add(elem_type, elem_value):
     return jsonify(res)
 
 
+@whitelist_bp.route('/add_bulk', methods=['POST'])
+@require_header_token
+def add_bulk():
+    """
+        Parse and add a batch of elements to be whitelisted. The elements
+        are in the export format: {"elements": [{"type", "element"}]}
+        :return: status of the operation in JSON
+    """
+    data = json.loads(request.data)
+    source = data.get("source", "backend")
+    res = whitelist.add_many(data.get("elements", []), source)
+    return jsonify(res)
+
+
 @whitelist_bp.route('/delete/<elem_id>', methods=['GET'])
 @require_header_token
 def delete(elem_id):
@@ -37,11 +53,27 @@ def delete(elem_id):
 @require_header_token
 def search(element):
     """
-        Search elements in the database.
+        Search elements in the database. Pass after_id (0 for the
+        first page) and limit to page through all the results.
         :return: potential results in JSON.
     """
-    res = whitelist.search(element)
-    return jsonify({"results": [e for e in res]})
+    after_id, limit = page_args(request.args, SEARCH_LIMIT)
+    res = [e for e in whitelist.search(element, after_id, limit)]
+    next_after_id = res[-1]["id"] if after_id is not None and len(res) == limit else None
+    return jsonify({"results": res, "next_after_id": next_after_id})
+
+
+@whitelist_bp.route('/list', methods=['GET'])
+@require_header_token
+def get_page():
+    """
+        List the whitelisted elements by pages, after the id after_id.
+        :return: a page of elements in JSON.
+    """
+    after_id, limit = page_args(request.args, SEARCH_LIMIT)
+    res = [e for e in whitelist.get_page(after_id or 0, limit)]
+    next_after_id = res[-1]["id"] if len(res) == limit else None
+    return jsonify({"results": res, "next_after_id": next_after_id})
 
 
 @whitelist_bp.route('/get/types')
@@ -59,10 +91,13 @@ def get_types():
 @require_get_token
 def get_all():
     """
-        Retreive a list of all elements.
+        Retreive a list of all elements, streamed in JSON or
+        in NDJSON (format=ndjson).
         :return: list of elements in JSON.
     """
-    res = whitelist.get_all()
-    return Response(json.dumps({"elements": [e for e in res]}),
-                    mimetype='application/json',
-                    headers={'Content-Disposition': 'attachment;filename=whitelist-export.json'})
+    ndjson = request.args.get("format") == "ndjson"
+    res = stream_export("elements", whitelist.get_all(), ndjson)
+    return Response(stream_with_context(res),
+                    mimetype='application/x-ndjson' if ndjson else 'application/json',
+                    headers={'Content-Disposition': 'attachment;filename=whitelist-export.{}'.format(
+                        "ndjson" if ndjson else "json")})
@@ -3,12 +3,22 @@
 
 import yaml
 import sys
-import io
 import os
 import re
+import shutil
+import sqlite3
+import tempfile
 import hashlib
+import zlib
 from functools import reduce
-from flask import send_file
+from flask import Response, stream_with_context
+from app.db.migrations import upgrade
+from app.definitions import definitions
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 class Config(object):
@@ -107,17 +117,154 @@ class Config(object):
         """
         return hashlib.sha256(clear_text.encode()).hexdigest()
 
-    def export_db(self):
+    def export_db(self, compression=None):
+        """
+            Export the database. A consistent snapshot is taken with
+            the SQLite backup API in a temporary file, which is then
+            streamed by chunks, compressed (gzip or zstd) if asked.
+            :return: streamed Response (the database) or dict on error.
+        """
+        if compression not in [None, "gzip", "zstd"]:
+            return {"status": False,
+                    "message": "Unknown compression"}
+        if compression == "zstd" and zstandard is None:
+            return {"status": False,
+                    "message": "The zstd compression is not available"}
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.dir, suffix=".sqlite3")
+        os.close(fd)
+        try:
+            src = sqlite3.connect(os.path.join(self.dir, "tinycheck.sqlite3"))
+            dst = sqlite3.connect(tmp_path)
+            try:
+                src.backup(dst)
+            finally:
+                src.close()
+                dst.close()
+            f = open(tmp_path, "rb")
+        finally:
+            # The opened snapshot is kept until the end of the stream.
+            os.remove(tmp_path)
+
+        size = os.fstat(f.fileno()).st_size
+        if compression == "gzip":
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == "zstd":
+            compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            compressor = None
+
+        def generate():
+            with f:
+                for chunk in iter(lambda: f.read(256 * 1024), b""):
+                    yield compressor.compress(chunk) if compressor else chunk
+                if compressor:
+                    yield compressor.flush()
+
+        filename = "tinycheck-export-db.sqlite"
+        headers = {}
+        if compression:
+            filename += ".gz" if compression == "gzip" else ".zst"
+        else:
+            headers["Content-Length"] = str(size)
+        headers["Content-Disposition"] = "attachment; filename={}".format(filename)
+        return Response(stream_with_context(generate()),
+                        mimetype="application/octet-stream",
+                        headers=headers)
+
+    def import_db(self, stream, merge=False):
         """
-            Export the database.
-            :return: send_file (the database)
+            Replace the database by an uploaded one, or merge it in
+            the database. The upload is streamed to a temporary file
+            and checked, then copied in the database with the SQLite
+            backup API, which is safe for the open connections and
+            the WAL.
+            :return: status of the operation in a dict
         """
-        with open(os.path.join(self.dir, "tinycheck.sqlite3"), "rb") as f:
-            return send_file(
-                io.BytesIO(f.read()),
-                mimetype="application/octet-stream",
-                as_attachment=True,
-                attachment_filename='tinycheck-export-db.sqlite')
+        db_path = os.path.join(self.dir, "tinycheck.sqlite3")
+        fd, tmp_path = tempfile.mkstemp(dir=self.dir, suffix=".sqlite3")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f, 64 * 1024)
+            with open(tmp_path, "rb") as f:
+                assert f.read(15) == b"SQLite format 3"
+
+            src = sqlite3.connect(tmp_path)
+            try:
+                assert src.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+                if merge:
+                    src.close()
+                    return self.merge_db(db_path, tmp_path)
+                dst = sqlite3.connect(db_path, timeout=30)
+                try:
+                    src.backup(dst)
+                finally:
+                    dst.close()
+            finally:
+                src.close()
+
+            # The imported database can be older than the application.
+            upgrade(db_path)
+            return {"status": True,
+                    "message": "Database updated"}
+        except:
+            return {"status": False,
+                    "message": "Error while database upload"}
+        finally:
+            os.remove(tmp_path)
+
+    def merge_db(self, db_path, src_path):
+        """
+            Merge the IOCs and the whitelisted elements of another
+            database which are not already known, in a single
+            transaction. The merged rows keep their source, prefixed
+            by "import-". The readers (eg. a running analysis) keep
+            working on their snapshot thanks to the WAL.
+            :return: status of the operation in a dict
+        """
+        iocs_types = [t["type"] for t in definitions["iocs_types"]]
+        whitelist_types = [t["type"] for t in definitions["whitelist_types"]]
+        ioc_value = "CASE WHEN s.type = 'snort' THEN s.value ELSE lower(s.value) END"
+
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("ATTACH DATABASE ? AS src", (src_path,))
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                iocs = conn.execute("""INSERT INTO main.iocs (value, type, tlp, tag, source, added_on)
+                                       SELECT {0} AS v, s.type, s.tlp, s.tag,
+                                              'import-' || coalesce(s.source, ''), s.added_on
+                                       FROM src.iocs s
+                                       WHERE s.type IN ({1})
+                                       AND NOT EXISTS (SELECT 1 FROM main.iocs m WHERE m.value = {0})
+                                       GROUP BY v""".format(ioc_value, ",".join("?" * len(iocs_types))),
+                                    iocs_types).rowcount
+                # Looked up by (type, element), indexed in every database. An
+                # element known with another type is ignored (unique element).
+                elements = conn.execute("""INSERT OR IGNORE INTO main.whitelist (element, type, source, added_on)
+                                           SELECT lower(s.element) AS e, s.type,
+                                                  'import-' || coalesce(s.source, ''), s.added_on
+                                           FROM src.whitelist s
+                                           WHERE s.type IN ({0})
+                                           AND NOT EXISTS (SELECT 1 FROM main.whitelist m
+                                                           WHERE m.type = s.type AND m.element = lower(s.element))
+                                           GROUP BY e""".format(",".join("?" * len(whitelist_types))),
+                                        whitelist_types).rowcount
+                total_iocs = conn.execute("SELECT COUNT(*) FROM src.iocs").fetchone()[0]
+                total_elements = conn.execute("SELECT COUNT(*) FROM src.whitelist").fetchone()[0]
+                conn.execute("COMMIT")
+            except:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+        return {"status": True,
+                "message": "{} IOCs and {} elements merged".format(iocs, elements),
+                "iocs": iocs,
+                "iocs_skipped": total_iocs - iocs,
+                "elements": elements,
+                "elements_skipped": total_elements - elements}
 
     def get_ifaces_in(self):
         """
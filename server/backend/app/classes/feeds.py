@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from app import db
+from app.db.models import Feed
+import json
+import time
+import os
+
+# State of the feeds, written by the watchers for the backend API.
+WATCHERS_STATUS = "/tmp/tinycheck-watchers.json"
+
+
+class Feeds(object):
+    """
+        State of the feeds polled by the watchers: the validators
+        (ETag, Last-Modified) of their last downloaded version.
+    """
+
+    def __init__(self):
+        return None
+
+    @staticmethod
+    def get(url):
+        """
+            Get the state of a feed, registering it if new.
+            :return: dict - id, etag, last_modified and last_sync.
+        """
+        feed = db.session.query(Feed).filter(Feed.url == url).first()
+        if feed is None:
+            feed = Feed(url)
+            db.session.add(feed)
+            db.session.commit()
+        return {"id": feed.id,
+                "url": feed.url,
+                "etag": feed.etag,
+                "last_modified": feed.last_modified,
+                "last_sync": feed.last_sync}
+
+    @staticmethod
+    def update(feed_id, etag, last_modified):
+        """
+            Record the validators of the last downloaded version of a
+            feed. The update is only staged in the session: it is
+            committed with the feed content.
+        """
+        db.session.query(Feed).filter(Feed.id == feed_id).update(
+            {"etag": etag, "last_modified": last_modified, "last_sync": int(time.time())})
+
+    @staticmethod
+    def write_status(feeds):
+        """
+            Write the state of the feeds polled by the watchers.
+        """
+        with open(WATCHERS_STATUS + ".tmp", "w") as f:
+            f.write(json.dumps({"updated_on": int(time.time()),
+                                "feeds": feeds}))
+        os.replace(WATCHERS_STATUS + ".tmp", WATCHERS_STATUS)
+
+    @staticmethod
+    def get_status():
+        """
+            Read the state of the feeds polled by the watchers.
+            :return: dict - the state of each feed.
+        """
+        try:
+            with open(WATCHERS_STATUS, "r") as f:
+                status = json.load(f)
+            status["status"] = True
+            return status
+        except:
+            return {"status": False,
+                    "message": "The watchers haven't synchronized any feed yet"}
@@ -3,10 +3,12 @@
 
 from app import db
 from app.db.models import Ioc
+from app.db.search import search_ids, SEARCH_LIMIT
 from sqlalchemy.sql import exists
 from app.definitions import definitions
+from app.validation import validate, all_types
 from flask import escape
-import re
+from itertools import islice
 import time
 
 
@@ -14,6 +16,20 @@ class IOCs(object):
     def __init__(self):
         return None
 
+    @staticmethod
+    def validate(ioc_type, ioc_tlp, ioc_value):
+        """
+            Check the TLP and the format of an IOC, and deduce its
+            type if unknown.
+            :return: tuple (ioc type, error message or None)
+        """
+        if ioc_tlp not in ["white", "green", "amber", "red"]:
+            return ioc_type, "Wrong IOC TLP"
+        if ioc_type != "unknown" and ioc_type not in all_types["iocs_types"]:
+            return ioc_type, "Wrong IOC type"
+        ioc_type, ioc_valid = validate("iocs_types", ioc_type, ioc_value)
+        return ioc_type, None if ioc_valid else "Wrong IOC format"
+
     @staticmethod
     def add(ioc_type, ioc_tag, ioc_tlp, ioc_value, source):
         """
@@ -22,55 +38,179 @@ class IOCs(object):
         """
 
         ioc_value = ioc_value.lower() if ioc_type != "snort" else ioc_value
-        ioc_valid = False
         if db.session.query(exists().where(Ioc.value == ioc_value)).scalar():
             return {"status": False,
                     "message": "IOC already exists",
                     "ioc": escape(ioc_value)}
-        elif ioc_tlp in ["white", "green", "amber", "red"]:
-            if ioc_type == "unknown":
-                for t in definitions["iocs_types"]:
-                    if t["regex"] and t["auto"]:
-                        if re.match(t["regex"], ioc_value):
-                            ioc_type = t["type"]
-                            ioc_valid = True
-            elif ioc_type in [t["type"] for t in definitions["iocs_types"]]:
-                for t in definitions["iocs_types"]:
-                    if t["type"] == ioc_type and t["regex"]:
-                        if re.match(t["regex"], ioc_value):
-                            ioc_valid = True
-                            break
-                    elif t["type"] == "snort" and ioc_value[0:6] == "alert ":
-                        ioc_valid = True
-                        break
-            else:
-                return {"status": True,
-                        "message": "Wrong IOC type",
-                        "ioc": escape(ioc_value),
-                        "type": escape(ioc_type)}
-
-            if ioc_valid:
-                added_on = int(time.time())
-                db.session.add(Ioc(ioc_value, ioc_type, ioc_tlp,
-                                   ioc_tag, source, added_on))
-                db.session.commit()
-                return {"status": True,
-                        "message": "IOC added",
-                        "ioc": escape(ioc_value),
-                        "type": escape(ioc_type),
-                        "tlp": escape(ioc_tlp),
-                        "tag": escape(ioc_tag),
-                        "source": escape(source),
-                        "added_on": escape(added_on)}
-            else:
-                return {"status": False,
-                        "message": "Wrong IOC format",
-                        "ioc": escape(ioc_value)}
-        else:
+
+        ioc_type, error = IOCs.validate(ioc_type, ioc_tlp, ioc_value)
+        if error is None:
+            added_on = int(time.time())
+            db.session.add(Ioc(ioc_value, ioc_type, ioc_tlp,
+                               ioc_tag, source, added_on))
+            db.session.commit()
+            return {"status": True,
+                    "message": "IOC added",
+                    "ioc": escape(ioc_value),
+                    "type": escape(ioc_type),
+                    "tlp": escape(ioc_tlp),
+                    "tag": escape(ioc_tag),
+                    "source": escape(source),
+                    "added_on": escape(added_on)}
+        elif error == "Wrong IOC type":
+            return {"status": True,
+                    "message": error,
+                    "ioc": escape(ioc_value),
+                    "type": escape(ioc_type)}
+        elif error == "Wrong IOC TLP":
             return {"status": False,
-                    "message": "Wrong IOC TLP",
+                    "message": error,
                     "ioc": escape(ioc_value),
                     "type": escape(ioc_tlp)}
+        else:
+            return {"status": False,
+                    "message": error,
+                    "ioc": escape(ioc_value)}
+
+    @staticmethod
+    def add_many(iocs, source):
+        """
+            Parse and add a batch of IOCs to the database, in a
+            single transaction. Each IOC is a dict containing its
+            type, tag, tlp and value.
+            :return: status of the operation with, for each IOC, its
+                     status: added, exists or the validation error.
+        """
+        results, rows = [], []
+        added_on = int(time.time())
+
+        # Validate the whole batch in memory.
+        for ioc in iocs:
+            try:
+                ioc_type, ioc_value = ioc["type"], ioc["value"]
+                ioc_value = ioc_value.lower() if ioc_type != "snort" else ioc_value
+                ioc_type, error = IOCs.validate(ioc_type, ioc["tlp"], ioc_value)
+                rows.append({"value": ioc_value, "type": ioc_type, "tlp": ioc["tlp"],
+                             "tag": ioc["tag"], "source": source, "added_on": added_on})
+            except (KeyError, TypeError, AttributeError):
+                error = "Wrong IOC"
+                rows.append(None)
+            results.append(error)
+
+        # Dedup against the DB with set-based queries.
+        existing = set()
+        candidates = list(set(r["value"] for r, e in zip(rows, results) if e is None))
+        for i in range(0, len(candidates), 500):
+            existing.update(v for v, in db.session.query(Ioc.value).filter(
+                Ioc.value.in_(candidates[i:i+500])))
+
+        to_insert = []
+        for i, row in enumerate(rows):
+            if results[i] is not None:
+                continue
+            if row["value"] in existing:
+                results[i] = "exists"
+            else:
+                existing.add(row["value"])
+                results[i] = "added"
+                to_insert.append(row)
+
+        # A concurrent writer (another MISP instance) may have added
+        # some of the values since the dedup: they are ignored.
+        added = 0
+        if to_insert:
+            added = db.session.execute(db.metadata.tables["iocs"].insert().prefix_with("OR IGNORE"),
+                                       to_insert).rowcount
+            db.session.commit()
+
+        return {"status": True,
+                "message": "{} IOCs added".format(added),
+                "added": added,
+                "exists": results.count("exists") + len(to_insert) - added,
+                "errors": len([r for r in results if r not in ["added", "exists"]]),
+                "results": results}
+
+    @staticmethod
+    def sync(iocs, source, to_delete=[], legacy_source=None):
+        """
+            Make the IOCs attributed to a source match the content of
+            a feed, in a single transaction: the new IOCs are inserted,
+            the ones no longer in the feed are deleted, as well as the
+            IOCs of to_delete (whatever their source). The IOCs of the
+            feed attributed to legacy_source are taken over. The IOCs
+            are consumed by batches, so they can be streamed from the
+            feed. to_delete is only read once the IOCs are consumed.
+            :return: status of the operation with its counters.
+        """
+        seen, total = set(), 0
+        added, deleted, claimed, unchanged, errors = 0, 0, 0, 0, 0
+        added_on = int(time.time())
+
+        iocs = iter(iocs)
+        while True:
+            items = list(islice(iocs, 500))
+            if not items:
+                break
+            total += len(items)
+
+            batch = {}
+            for ioc in items:
+                try:
+                    ioc_type, ioc_value = ioc["type"], ioc["value"]
+                    ioc_value = ioc_value.lower() if ioc_type != "snort" else ioc_value
+                    ioc_type, error = IOCs.validate(ioc_type, ioc["tlp"], ioc_value)
+                except (KeyError, TypeError, AttributeError):
+                    error = "Wrong IOC"
+                if error is not None:
+                    errors += 1
+                elif ioc_value not in seen:
+                    seen.add(ioc_value)
+                    batch[ioc_value] = {"value": ioc_value, "type": ioc_type, "tlp": ioc["tlp"],
+                                        "tag": ioc["tag"], "source": source, "added_on": added_on}
+
+            # Set-based diff between the batch and the DB.
+            to_claim = []
+            for value, ioc_id, ioc_source in db.session.query(Ioc.value, Ioc.id, Ioc.source).filter(
+                    Ioc.value.in_(list(batch))):
+                del batch[value]
+                if ioc_source == source:
+                    unchanged += 1
+                elif legacy_source is not None and ioc_source == legacy_source:
+                    to_claim.append(ioc_id)
+            if to_claim:
+                db.session.query(Ioc).filter(Ioc.id.in_(to_claim)).update(
+                    {"source": source}, synchronize_session=False)
+                claimed += len(to_claim)
+            if batch:
+                db.session.execute(db.metadata.tables["iocs"].insert(), list(batch.values()))
+                added += len(batch)
+
+        # The IOCs of the source which are no longer in the feed.
+        stale = [i for i, v in db.session.query(Ioc.id, Ioc.value).filter(
+            Ioc.source == source).yield_per(1000) if v not in seen]
+        removed = []
+        for ioc in to_delete:
+            try:
+                removed.append(ioc["value"])
+            except (KeyError, TypeError):
+                continue
+
+        for i in range(0, len(stale), 500):
+            deleted += db.session.query(Ioc).filter(
+                Ioc.id.in_(stale[i:i+500])).delete(synchronize_session=False)
+        for i in range(0, len(removed), 500):
+            deleted += db.session.query(Ioc).filter(
+                Ioc.value.in_(removed[i:i+500])).delete(synchronize_session=False)
+        db.session.commit()
+
+        return {"status": True,
+                "message": "{} IOCs added, {} deleted".format(added, deleted),
+                "items": total,
+                "added": added,
+                "deleted": deleted,
+                "claimed": claimed,
+                "unchanged": unchanged,
+                "errors": errors}
 
     @staticmethod
     def delete(ioc_id):
@@ -103,14 +243,16 @@ class IOCs(object):
                     "message": "IOC not found"}
 
     @staticmethod
-    def search(term):
+    def search(term, after_id=None, limit=SEARCH_LIMIT):
         """
             Search IOCs in the database.
-            :return: generator of results.
+            :return: generator of results, the best ranked first
+                     or by id if after_id is given.
         """
-        iocs = db.session.query(Ioc).filter(
-            Ioc.value.like(term.replace("*", "%"))).all()
-        for ioc in iocs:
+        ids = search_ids("iocs", "value", term, limit, after_id)
+        iocs = db.session.query(Ioc).filter(Ioc.id.in_(ids)).all() if ids else []
+        rank = {i: n for n, i in enumerate(ids)}
+        for ioc in sorted(iocs, key=lambda ioc: rank[ioc.id]):
             ioc = ioc.__dict__
             yield {"id": ioc["id"],
                    "type": ioc["type"],
@@ -140,15 +282,38 @@ class IOCs(object):
                    "name": t["name"]}
 
     @staticmethod
-    def get_all():
+    def get_page(after_id=0, limit=SEARCH_LIMIT):
         """
-            Get all IOCs from the database
+            Get a page of IOCs, ordered by id.
             :return: generator of the records.
         """
-        for ioc in db.session.query(Ioc).all():
-            ioc = ioc.__dict__
-            yield {"id": ioc["id"],
-                   "type": ioc["type"],
-                   "tag": ioc["tag"],
-                   "tlp": ioc["tlp"],
-                   "value": ioc["value"]}
+        for ioc in db.session.query(Ioc.id, Ioc.type, Ioc.tag, Ioc.tlp, Ioc.value, Ioc.source).filter(
+                Ioc.id > after_id).order_by(Ioc.id).limit(limit):
+            yield {"id": ioc.id,
+                   "type": ioc.type,
+                   "tag": ioc.tag,
+                   "tlp": ioc.tlp,
+                   "value": ioc.value,
+                   "source": ioc.source}
+
+    @staticmethod
+    def get_all(chunk_size=1000):
+        """
+            Get all IOCs from the database, chunk_size rows at a time
+            (keyset pagination, so the memory use doesn't depend on
+            the number of IOCs).
+            :return: generator of the records.
+        """
+        after_id = 0
+        while True:
+            iocs = db.session.query(Ioc.id, Ioc.type, Ioc.tag, Ioc.tlp, Ioc.value).filter(
+                Ioc.id > after_id).order_by(Ioc.id).limit(chunk_size).all()
+            for ioc in iocs:
+                yield {"id": ioc.id,
+                       "type": ioc.type,
+                       "tag": ioc.tag,
+                       "tlp": ioc.tlp,
+                       "value": ioc.value}
+            if len(iocs) < chunk_size:
+                break
+            after_id = iocs[-1].id
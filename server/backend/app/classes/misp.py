@@ -3,16 +3,34 @@
 
 from app import db
 from app.db.models import MISPInst
+from app.classes.iocs import IOCs
 from app.definitions import definitions as defs
+from app.validation import classify_many
 
 from sqlalchemy.sql import exists
 from urllib.parse import unquote
 from flask import escape
+from concurrent.futures import ThreadPoolExecutor
 from pymisp import PyMISP
+import threading
 import re
 import time
 import sys
 
+# Attributes fetched per request.
+PAGE_SIZE = 1000
+MISP_TYPES = ["ip-dst", "domain", "snort", "x509-fingerprint-sha1"]
+TLP_TAG = re.compile(r"^(?:tlp:)(red|green|amber|white)")
+IOCS_TAGS = set(t["tag"] for t in defs["iocs_tags"])
+
+# Connection state of the instances, refreshed in the background
+# every HEALTH_TTL seconds: {misp_id: {"connected", "checked_on"}}.
+HEALTH_TTL = 300
+HEALTH_TIMEOUT = 5
+health = {}
+health_lock = threading.Lock()
+health_checker = None
+
 
 class MISP(object):
     def __init__(self):
@@ -38,9 +56,11 @@ class MISP(object):
         if name:
             if self.test_instance(url, apikey, verify):
                 added_on = int(time.time())
-                db.session.add(MISPInst(name, escape(
-                    url), apikey, verify, added_on, last_sync))
+                misp = MISPInst(name, escape(url), apikey, verify, added_on, last_sync)
+                db.session.add(misp)
                 db.session.commit()
+                with health_lock:
+                    health[misp.id] = {"connected": True, "checked_on": added_on}
                 return {"status": True,
                         "message": "MISP instance added"}
             else:
@@ -59,6 +79,8 @@ class MISP(object):
         if db.session.query(exists().where(MISPInst.id == misp_id)).scalar():
             db.session.query(MISPInst).filter_by(id=misp_id).delete()
             db.session.commit()
+            with health_lock:
+                health.pop(int(misp_id), None)
             return {"status": True,
                     "message": "MISP instance deleted"}
         else:
@@ -67,93 +89,180 @@ class MISP(object):
 
     def get_instances(self):
         """
-            Get MISP instances from the database
+            Get MISP instances from the database, with their last known
+            connection state (None if not checked yet).
             :return: generator of the records.
         """
+        self.start_health_checker()
         for misp in db.session.query(MISPInst).all():
             misp = misp.__dict__
+            state = health.get(misp["id"], {})
             yield {"id": misp["id"],
                    "name": misp["name"],
                    "url": misp["url"],
                    "apikey": misp["apikey"],
                    "verifycert": True if misp["verifycert"] else False,
-                   "connected": self.test_instance(misp["url"], misp["apikey"], misp["verifycert"]),
+                   "connected": state.get("connected"),
+                   "checked_on": state.get("checked_on"),
                    "lastsync": misp["last_sync"]}
 
     @staticmethod
-    def test_instance(url, apikey, verify):
+    def test_instance(url, apikey, verify, timeout=None):
         """
             Test the connection of the MISP instance.
-            :return: generator of the records.
+            :return: bool, True if connected.
         """
         try:
-            PyMISP(url, apikey, verify)
+            PyMISP(url, apikey, verify, timeout=timeout)
             return True
         except:
             return False
 
+    def check_health(self):
+        """
+            Test the connection of the instances whose state is older
+            than HEALTH_TTL, in parallel and with a short timeout.
+        """
+        instances = [(m.id, m.url, m.apikey, m.verifycert)
+                     for m in db.session.query(MISPInst).all()]
+        db.session.remove()
+
+        now = time.time()
+        expired = [i for i in instances
+                   if health.get(i[0], {}).get("checked_on", 0) + HEALTH_TTL <= now]
+        if expired:
+            with ThreadPoolExecutor(max_workers=min(len(expired), 4)) as executor:
+                states = executor.map(lambda i: self.test_instance(i[1], i[2], i[3], HEALTH_TIMEOUT),
+                                      expired)
+                for i, connected in zip(expired, states):
+                    with health_lock:
+                        health[i[0]] = {"connected": connected,
+                                        "checked_on": int(time.time())}
+
+        with health_lock:
+            for misp_id in set(health) - set(i[0] for i in instances):
+                del health[misp_id]
+
+    def health_loop(self):
+        """
+            Refresh the connection state of the instances forever.
+        """
+        while True:
+            try:
+                self.check_health()
+            except:
+                pass
+            time.sleep(10)
+
+    def start_health_checker(self):
+        """
+            Start the background health checker, if not running.
+        """
+        global health_checker
+        with health_lock:
+            if health_checker is None or not health_checker.is_alive():
+                health_checker = threading.Thread(target=self.health_loop, daemon=True)
+                health_checker.start()
+
+    @staticmethod
+    def get_attributes(m, date_from, page_size=PAGE_SIZE):
+        """
+            Get the network activity attributes of a MISP instance,
+            page by page, so only one page is held in memory.
+            :return: generator of the pages (lists of attributes).
+        """
+        page = 1
+        while True:
+            r = m.search("attributes", category="Network activity", date_from=date_from,
+                         type_attribute=MISP_TYPES, page=page, limit=page_size)
+            attrs = r["Attribute"] if isinstance(r, dict) else r
+            if attrs:
+                yield attrs
+            if len(attrs) < page_size:
+                break
+            page += 1
+
     @staticmethod
-    def update_sync(misp_id):
+    def parse_attributes(attrs):
+        """
+            Convert a page of MISP attributes to IOCs.
+            :return: list of the IOCs.
+        """
+        attrs = [attr for attr in attrs if attr["type"] in MISP_TYPES]
+
+        # Deduce the IOCs types.
+        types = classify_many("iocs_types", [attr["value"] for attr in attrs])
+
+        iocs = []
+        for attr, ioc_type in zip(attrs, types):
+            if ioc_type is None:
+                if "alert " in attr["value"][0:6]:
+                    ioc_type = "snort"
+                else:
+                    continue
+
+            ioc = {"value": attr["value"],
+                   "type": ioc_type,
+                   "tag": "suspect",
+                   "tlp": "white"}
+
+            for tag in attr.get("Tag", []):
+                # Add a TLP to the IOC if defined in tags.
+                tlp = TLP_TAG.search(tag["name"].lower())
+                if tlp: ioc["tlp"] = tlp.group(1)
+
+                # Add possible tag (need to match TinyCheck tags)
+                if tag["name"].lower() in IOCS_TAGS:
+                    ioc["tag"] = tag["name"].lower()
+            iocs.append(ioc)
+        return iocs
+
+    def sync_instance(self, misp_id, page_size=PAGE_SIZE):
         """
-            Update the last synchronization date by the actual date.
-            :return: bool, True if updated.
+            Add the new IOCs of a MISP instance to the database. The
+            attributes are fetched page by page and each page is added
+            in a single transaction. The last synchronization date only
+            advances once every page is committed, to the date of the
+            beginning of the synchronization.
+            :return: status of the synchronization with its counters.
         """
+        start = time.time()
+        pages, attributes, added, exists, errors = 0, 0, 0, 0, 0
+        source = "misp-{}".format(misp_id)
         try:
             misp = MISPInst.query.get(int(misp_id))
-            misp.last_sync = int(time.time())
+            if misp is None or not (misp.url and misp.apikey):
+                return {"status": False,
+                        "message": "MISP instance not found"}
+            date_from = int(misp.last_sync)
+            m = PyMISP(misp.url, misp.apikey, misp.verifycert)
+            for attrs in self.get_attributes(m, date_from, page_size):
+                pages += 1
+                attributes += len(attrs)
+                iocs = self.parse_attributes(attrs)
+                res = IOCs.add_many(iocs, source)
+                added += res["added"]
+                exists += res["exists"]
+                errors += res["errors"] + len(attrs) - len(iocs)
+
+            misp.last_sync = int(start)
             db.session.commit()
-            return True
+            duration = time.time() - start
+            return {"status": True,
+                    "message": "{} IOCs added".format(added),
+                    "pages": pages,
+                    "attributes": attributes,
+                    "added": added,
+                    "exists": exists,
+                    "errors": errors,
+                    "duration": round(duration, 3),
+                    "rate": round(attributes / duration, 1) if duration else attributes}
         except:
-            return False
-
-    @staticmethod
-    def get_iocs(misp_id):
-        """
-            Get all IOCs from specific MISP instance
-            :return: generator containing the IOCs.
-        """
-        misp = MISPInst.query.get(int(misp_id))
-        if misp is not None:
-            if misp.url and misp.apikey:
-                try:
-                    # Connect to MISP instance and get network activity attributes.
-                    m = PyMISP(misp.url, misp.apikey, misp.verifycert)
-                    r = m.search("attributes", category="Network activity", date_from=int(misp.last_sync))
-                except:
-                    print("Unable to connect to the MISP instance ({}/{}).".format(misp.url, misp.apikey))
-                    return []
-
-                for attr in r["Attribute"]:
-                    if attr["type"] in ["ip-dst", "domain", "snort", "x509-fingerprint-sha1"]:
-
-                        ioc = {"value": attr["value"],
-                               "type": None,
-                               "tag": "suspect",
-                               "tlp": "white"}
-
-                        # Deduce the IOC type.
-                        if re.match(defs["iocs_types"][0]["regex"], attr["value"]):
-                            ioc["type"] = "ip4addr"
-                        elif re.match(defs["iocs_types"][1]["regex"], attr["value"]):
-                            ioc["type"] = "ip6addr"
-                        elif re.match(defs["iocs_types"][2]["regex"], attr["value"]):
-                            ioc["type"] = "cidr"
-                        elif re.match(defs["iocs_types"][3]["regex"], attr["value"]):
-                            ioc["type"] = "domain"
-                        elif re.match(defs["iocs_types"][4]["regex"], attr["value"]):
-                            ioc["type"] = "sha1cert"
-                        elif "alert " in attr["value"][0:6]:
-                            ioc["type"] = "snort"
-                        else:
-                            continue
-
-                        if "Tag" in attr:
-                            for tag in attr["Tag"]:
-                                # Add a TLP to the IOC if defined in tags.
-                                tlp = re.search(r"^(?:tlp:)(red|green|amber|white)", tag['name'].lower())
-                                if tlp: ioc["tlp"] = tlp.group(1)
-
-                                # Add possible tag (need to match TinyCheck tags)
-                                if tag["name"].lower() in [t["tag"] for t in defs["iocs_tags"]]:
-                                    ioc["tag"] = tag["name"].lower()
-                        yield ioc
+            db.session.rollback()
+            return {"status": False,
+                    "message": "Unable to synchronize the MISP instance",
+                    "pages": pages,
+                    "attributes": attributes,
+                    "added": added}
+        finally:
+            db.session.remove()
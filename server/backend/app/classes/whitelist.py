@@ -3,10 +3,12 @@
 
 from app import db
 from app.db.models import Whitelist
+from app.db.search import search_ids, SEARCH_LIMIT
 from sqlalchemy.sql import exists
 from app.definitions import definitions
+from app.validation import validate
 from flask import escape
-import re
+from itertools import islice
 import time
 
 
@@ -14,6 +16,15 @@ class WhiteList(object):
     def __init__(self):
         return None
 
+    @staticmethod
+    def validate(elem_type, elem_value):
+        """
+            Check the format of an element, and deduce its
+            type if unknown.
+            :return: tuple (element type, bool - element validity)
+        """
+        return validate("whitelist_types", elem_type, elem_value)
+
     @staticmethod
     def add(elem_type, elem_value, source):
         """
@@ -21,25 +32,13 @@ class WhiteList(object):
             :return: status of the operation in a dict
         """
         elem_value = elem_value.lower()
-        elem_valid = False
 
         if db.session.query(exists().where(Whitelist.element == elem_value)).scalar():
             return {"status": False,
                     "message": "Element already whitelisted",
                     "element": escape(elem_value)}
-        elif elem_type == "unknown":
-            for t in definitions["whitelist_types"]:
-                if t["regex"] and t["auto"]:
-                    if re.match(t["regex"], elem_value):
-                        elem_type = t["type"]
-                        elem_valid = True
-                        break
-        elif elem_type in [t["type"] for t in definitions["whitelist_types"]]:
-            for t in definitions["whitelist_types"]:
-                if t["type"] == elem_type and t["regex"]:
-                    if re.match(t["regex"], elem_value):
-                        elem_valid = True
-                        break
+
+        elem_type, elem_valid = WhiteList.validate(elem_type, elem_value)
         if elem_valid:
             added_on = int(time.time())
             db.session.add(Whitelist(elem_value, elem_type, source, added_on))
@@ -52,6 +51,141 @@ class WhiteList(object):
                     "message": "Wrong element format",
                     "element": escape(elem_value)}
 
+    @staticmethod
+    def add_many(elements, source):
+        """
+            Parse and add a batch of elements to be whitelisted, in
+            a single transaction. Each element is a dict containing
+            its type and element.
+            :return: status of the operation with, for each element,
+                     its status: added, exists or the validation error.
+        """
+        results, rows = [], []
+        added_on = int(time.time())
+
+        # Validate the whole batch in memory.
+        for elem in elements:
+            try:
+                elem_value = elem["element"].lower()
+                elem_type, elem_valid = WhiteList.validate(elem["type"], elem_value)
+                rows.append({"element": elem_value, "type": elem_type,
+                             "source": source, "added_on": added_on})
+                results.append(None if elem_valid else "Wrong element format")
+            except (KeyError, TypeError, AttributeError):
+                rows.append(None)
+                results.append("Wrong element")
+
+        # Dedup against the DB with set-based queries.
+        existing = set()
+        candidates = list(set(r["element"] for r, e in zip(rows, results) if e is None))
+        for i in range(0, len(candidates), 500):
+            existing.update(v for v, in db.session.query(Whitelist.element).filter(
+                Whitelist.element.in_(candidates[i:i+500])))
+
+        to_insert = []
+        for i, row in enumerate(rows):
+            if results[i] is not None:
+                continue
+            if row["element"] in existing:
+                results[i] = "exists"
+            else:
+                existing.add(row["element"])
+                results[i] = "added"
+                to_insert.append(row)
+
+        if to_insert:
+            db.session.execute(db.metadata.tables["whitelist"].insert(), to_insert)
+            db.session.commit()
+
+        return {"status": True,
+                "message": "{} elements whitelisted".format(len(to_insert)),
+                "added": len(to_insert),
+                "exists": results.count("exists"),
+                "errors": len([r for r in results if r not in ["added", "exists"]]),
+                "results": results}
+
+    @staticmethod
+    def sync(elements, source, to_delete=[], legacy_source=None):
+        """
+            Make the elements attributed to a source match the content
+            of a feed, in a single transaction: the new elements are
+            inserted, the ones no longer in the feed are deleted, as
+            well as the elements of to_delete (whatever their source).
+            The elements of the feed attributed to legacy_source are
+            taken over. The elements are consumed by batches, so they
+            can be streamed from the feed. to_delete is only read once
+            the elements are consumed.
+            :return: status of the operation with its counters.
+        """
+        seen, total = set(), 0
+        added, deleted, claimed, unchanged, errors = 0, 0, 0, 0, 0
+        added_on = int(time.time())
+
+        elements = iter(elements)
+        while True:
+            items = list(islice(elements, 500))
+            if not items:
+                break
+            total += len(items)
+
+            batch = {}
+            for elem in items:
+                try:
+                    elem_value = elem["element"].lower()
+                    elem_type, elem_valid = WhiteList.validate(elem["type"], elem_value)
+                except (KeyError, TypeError, AttributeError):
+                    elem_valid = False
+                if not elem_valid:
+                    errors += 1
+                elif elem_value not in seen:
+                    seen.add(elem_value)
+                    batch[elem_value] = {"element": elem_value, "type": elem_type,
+                                         "source": source, "added_on": added_on}
+
+            # Set-based diff between the batch and the DB.
+            to_claim = []
+            for value, elem_id, elem_source in db.session.query(
+                    Whitelist.element, Whitelist.id, Whitelist.source).filter(
+                    Whitelist.element.in_(list(batch))):
+                if batch.pop(value, None) is not None and elem_source == source:
+                    unchanged += 1
+                if legacy_source is not None and elem_source == legacy_source:
+                    to_claim.append(elem_id)
+            if to_claim:
+                db.session.query(Whitelist).filter(Whitelist.id.in_(to_claim)).update(
+                    {"source": source}, synchronize_session=False)
+                claimed += len(to_claim)
+            if batch:
+                db.session.execute(db.metadata.tables["whitelist"].insert(), list(batch.values()))
+                added += len(batch)
+
+        # The elements of the source which are no longer in the feed.
+        stale = [i for i, v in db.session.query(Whitelist.id, Whitelist.element).filter(
+            Whitelist.source == source).yield_per(1000) if v not in seen]
+        removed = []
+        for elem in to_delete:
+            try:
+                removed.append(elem["element"].lower())
+            except (KeyError, TypeError, AttributeError):
+                continue
+
+        for i in range(0, len(stale), 500):
+            deleted += db.session.query(Whitelist).filter(
+                Whitelist.id.in_(stale[i:i+500])).delete(synchronize_session=False)
+        for i in range(0, len(removed), 500):
+            deleted += db.session.query(Whitelist).filter(
+                Whitelist.element.in_(removed[i:i+500])).delete(synchronize_session=False)
+        db.session.commit()
+
+        return {"status": True,
+                "message": "{} elements whitelisted, {} deleted".format(added, deleted),
+                "items": total,
+                "added": added,
+                "deleted": deleted,
+                "claimed": claimed,
+                "unchanged": unchanged,
+                "errors": errors}
+
     @staticmethod
     def delete(elem_id):
         """
@@ -83,14 +217,16 @@ class WhiteList(object):
                     "message": "Element not found"}
 
     @staticmethod
-    def search(element):
+    def search(element, after_id=None, limit=SEARCH_LIMIT):
         """
             Search elements in the database.
-            :return: generator containing elements.
+            :return: generator containing elements, the best ranked first
+                     or by id if after_id is given.
         """
-        elems = db.session.query(Whitelist).filter(
-            Whitelist.element.like(element.replace("*", "%"))).all()
-        for elem in elems:
+        ids = search_ids("whitelist", "element", element, limit, after_id)
+        elems = db.session.query(Whitelist).filter(Whitelist.id.in_(ids)).all() if ids else []
+        rank = {i: n for n, i in enumerate(ids)}
+        for elem in sorted(elems, key=lambda elem: rank[elem.id]):
             elem = elem.__dict__
             yield {"id": elem["id"],
                    "type": elem["type"],
@@ -106,12 +242,30 @@ class WhiteList(object):
             yield {"type": t["type"], "name": t["name"]}
 
     @staticmethod
-    def get_all():
+    def get_page(after_id=0, limit=SEARCH_LIMIT):
         """
-            Retrieve all whitelisted elements.
+            Retrieve a page of whitelisted elements, ordered by id.
             :return: generator containing elements.
         """
-        for elem in db.session.query(Whitelist).all():
-            elem = elem.__dict__
-            yield {"type": elem["type"],
-                   "element": elem["element"]}
+        for elem in db.session.query(Whitelist.id, Whitelist.type, Whitelist.element).filter(
+                Whitelist.id > after_id).order_by(Whitelist.id).limit(limit):
+            yield {"id": elem.id,
+                   "type": elem.type,
+                   "element": elem.element}
+
+    @staticmethod
+    def get_all(chunk_size=1000):
+        """
+            Retrieve all whitelisted elements, chunk_size rows at a time.
+            :return: generator containing elements.
+        """
+        after_id = 0
+        while True:
+            elems = db.session.query(Whitelist.id, Whitelist.type, Whitelist.element).filter(
+                Whitelist.id > after_id).order_by(Whitelist.id).limit(chunk_size).all()
+            for elem in elems:
+                yield {"type": elem.type,
+                       "element": elem.element}
+            if len(elems) < chunk_size:
+                break
+            after_id = elems[-1].id
@@ -1,14 +1,39 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from sqlalchemy import create_engine, MetaData, Table
+from sqlalchemy import create_engine, MetaData, Table, event
 from sqlalchemy.orm import scoped_session, mapper
 from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.pool import QueuePool
+from app.db.migrations import upgrade
 import sys
 
 parent = "/".join(sys.path[0].split("/")[:-2])
+
+# Upgrade the database scheme, if needed, before using it.
+upgrade('/{}/tinycheck.sqlite3'.format(parent))
+
 engine = create_engine(
-    'sqlite:////{}/tinycheck.sqlite3'.format(parent), convert_unicode=True)
+    'sqlite:////{}/tinycheck.sqlite3'.format(parent), convert_unicode=True,
+    poolclass=QueuePool, pool_size=5, max_overflow=10,
+    connect_args={"check_same_thread": False, "timeout": 30})
+
+
+@event.listens_for(engine, "connect")
+def set_pragmas(dbapi_connection, connection_record):
+    """
+        Tune each new connection. The WAL journal lets the readers
+        (backend, analysis) work while the watchers are writing.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute("PRAGMA cache_size = -8000")
+    cursor.execute("PRAGMA mmap_size = 67108864")
+    cursor.execute("PRAGMA busy_timeout = 30000")
+    cursor.close()
+
+
 metadata = MetaData(bind=engine)
 session = scoped_session(sessionmaker(
     autocommit=False, autoflush=False, bind=engine))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+"""
+    Versioned migrations of the database. The version of a database
+    is stored in its user_version pragma: the migration at the index i
+    upgrades a database from the version i to the version i + 1.
+    A migration is a list of statements or a function taking the
+    connection. Migrations must only be appended to this list.
+"""
+
+
+def fts_index(conn):
+    """
+        Trigram full-text indexes of the IOCs values and whitelisted
+        elements, kept in sync by triggers. Skipped if the SQLite
+        library is too old (the searches then fall back to LIKE), and
+        retried at startup by upgrade() once it has been upgraded.
+    """
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return
+    for table, column in [("iocs", "value"), ("whitelist", "element")]:
+        conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS {0}_fts USING fts5({1},
+                        content='{0}', content_rowid='id', tokenize='trigram')""".format(table, column))
+        conn.execute("""CREATE TRIGGER IF NOT EXISTS {0}_fts_insert AFTER INSERT ON {0} BEGIN
+                            INSERT INTO {0}_fts(rowid, {1}) VALUES (new.id, new.{1});
+                        END""".format(table, column))
+        conn.execute("""CREATE TRIGGER IF NOT EXISTS {0}_fts_delete AFTER DELETE ON {0} BEGIN
+                            INSERT INTO {0}_fts({0}_fts, rowid, {1}) VALUES ('delete', old.id, old.{1});
+                        END""".format(table, column))
+        conn.execute("""CREATE TRIGGER IF NOT EXISTS {0}_fts_update AFTER UPDATE OF {1} ON {0} BEGIN
+                            INSERT INTO {0}_fts({0}_fts, rowid, {1}) VALUES ('delete', old.id, old.{1});
+                            INSERT INTO {0}_fts(rowid, {1}) VALUES (new.id, new.{1});
+                        END""".format(table, column))
+        conn.execute("INSERT INTO {0}_fts({0}_fts) VALUES ('rebuild')".format(table))
+
+
+migrations = [
+    # 1 - Indexes used by the analysis and the IOCs / whitelist lookups,
+    #     IOCs values normalized and made unique. The duplicates differing
+    #     only by their case are deleted first, and the unique index is
+    #     created after (it could exist, created by an older scheme.sql).
+    ["DROP INDEX IF EXISTS iocs_value",
+     """DELETE FROM iocs WHERE type != 'snort' AND id NOT IN
+        (SELECT MIN(id) FROM iocs WHERE type != 'snort' GROUP BY lower(value))""",
+     "UPDATE iocs SET value = lower(value) WHERE type != 'snort'",
+     "DELETE FROM iocs WHERE id NOT IN (SELECT MIN(id) FROM iocs GROUP BY value)",
+     "CREATE UNIQUE INDEX IF NOT EXISTS iocs_value ON iocs(value)",
+     "CREATE INDEX IF NOT EXISTS iocs_type_value ON iocs(type, value, tag)",
+     "CREATE INDEX IF NOT EXISTS whitelist_type_element ON whitelist(type, element)"],
+    # 2 - Full-text indexes for the IOCs and whitelist searches.
+    fts_index,
+    # 3 - State of the watched feeds, for the conditional requests.
+    ["""CREATE TABLE IF NOT EXISTS feeds (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                          url TEXT NOT NULL UNIQUE,
+                                          etag TEXT,
+                                          last_modified TEXT,
+                                          last_sync INTEGER)"""],
+]
+
+# Steps of the migrations which can be skipped (e.g. by an old SQLite),
+# retried at each startup while the table they create is missing:
+# (version of the migration, table, function).
+optional = [(2, "iocs_fts", fts_index)]
+
+
+def upgrade(db_path):
+    """
+        Apply the missing migrations to the database, each one in
+        its own transaction, then retry the skipped optional steps.
+        :return: int - the database version.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        for target, migration in enumerate(migrations, start=1):
+            # Lock the DB before reading its version, as the backend
+            # and the watchers can start at the same time.
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                conn.execute("ROLLBACK")
+                continue
+            try:
+                if callable(migration):
+                    migration(conn)
+                else:
+                    for statement in migration:
+                        conn.execute(statement)
+                conn.execute("PRAGMA user_version = {}".format(target))
+                conn.execute("COMMIT")
+            except:
+                conn.execute("ROLLBACK")
+                raise
+        for version, table, step in optional:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version and \
+                    conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone() is None:
+                try:
+                    step(conn)
+                except:
+                    conn.execute("ROLLBACK")
+                    raise
+            conn.execute("COMMIT")
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
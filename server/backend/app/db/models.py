@@ -29,6 +29,12 @@ class MISPInst(db.Model):
         self.last_sync = last_sync
 
 
+class Feed(db.Model):
+    def __init__(self, url):
+        self.url = url
+
+
 db.mapper(Whitelist, db.Table('whitelist', db.metadata, autoload=True))
 db.mapper(Ioc, db.Table('iocs', db.metadata, autoload=True))
 db.mapper(MISPInst, db.Table('misp', db.metadata, autoload=True))
+db.mapper(Feed, db.Table('feeds', db.metadata, autoload=True))
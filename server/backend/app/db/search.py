@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from app import db
+from sqlalchemy import text
+import re
+
+"""
+    Substring searches over the IOCs and the whitelist. The trigram
+    full-text indexes created by the migrations narrow down the
+    candidates, the LIKE pattern is then applied on them only. If a
+    table has no full-text index (old SQLite) or if the searched term
+    is too short for a trigram, the search falls back to LIKE.
+"""
+
+# Hard cap of the number of results returned by a search, and
+# number of candidates ranked (ranking every match of a common
+# substring in a large table would cost a full scan).
+SEARCH_LIMIT = 500
+RANKED_CANDIDATES = 2000
+
+fts_tables = {}
+
+
+def has_fts(table):
+    """
+        Check (once) if the full-text index of a table exists.
+        :return: bool
+    """
+    if table not in fts_tables:
+        fts_tables[table] = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": "{}_fts".format(table)}).first() is not None
+    return fts_tables[table]
+
+
+def search_ids(table, column, term, limit=SEARCH_LIMIT, after_id=None):
+    """
+        Search a term, where * is a wildcard, in a column. If after_id
+        is given, the results are paged in the order of their ids
+        instead of being ranked.
+        :return: list of the matching ids.
+    """
+    pattern = term.replace("*", "%")
+    needles = [n for n in re.split(r"[*%_]", term) if len(n) >= 3]
+
+    if needles and has_fts(table):
+        query = " AND ".join('"{}"'.format(n.replace('"', '""')) for n in needles)
+        if after_id is not None:
+            sql = """SELECT t.id FROM {0}_fts f JOIN {0} t ON t.id = f.rowid
+                     WHERE {0}_fts MATCH :query AND f.rowid > :after_id AND t.{1} LIKE :pattern
+                     ORDER BY f.rowid LIMIT :limit""".format(table, column)
+            params = {"query": query, "pattern": pattern, "limit": limit, "after_id": after_id}
+            return [row[0] for row in db.session.execute(text(sql), params)]
+        sql = """SELECT id FROM (SELECT t.id AS id, f.rank AS rank FROM {0}_fts f
+                                 JOIN {0} t ON t.id = f.rowid
+                                 WHERE {0}_fts MATCH :query AND t.{1} LIKE :pattern
+                                 LIMIT :candidates)
+                 ORDER BY rank LIMIT :limit""".format(table, column)
+        params = {"query": query, "pattern": pattern, "limit": limit,
+                  "candidates": max(limit, RANKED_CANDIDATES)}
+    else:
+        sql = """SELECT id FROM {0} WHERE id > :after_id AND {1} LIKE :pattern
+                 ORDER BY id LIMIT :limit""".format(table, column)
+        params = {"pattern": pattern, "limit": limit, "after_id": after_id or 0}
+
+    return [row[0] for row in db.session.execute(text(sql), params)]
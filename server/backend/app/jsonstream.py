@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import codecs
+import gzip
+import json
+
+"""
+    Incremental parsing of the IOCs / whitelist feeds. A feed is
+    read by chunks and its items are yielded one by one, so the
+    memory use doesn't depend on the size of the feed. Gzipped
+    feeds and NDJSON feeds (one item per line) are supported.
+"""
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACES = " \t\n\r"
+NUMBER_CHARS = "0123456789.eE+-"
+
+decoder = json.JSONDecoder()
+
+
+def open_feed(f):
+    """
+        Wrap a binary file object, un-gzipping it if needed.
+        :return: binary file object.
+    """
+    if f.read(2) == b"\x1f\x8b":
+        f.seek(0)
+        return gzip.GzipFile(fileobj=f)
+    f.seek(0)
+    return f
+
+
+class Reader(object):
+    """
+        Text buffer over a binary file object, read by chunks.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+            Read the next chunk, dropping the consumed part of the buffer.
+            :return: bool - False at the end of the file.
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(CHUNK_SIZE)
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(chunk, final=not chunk)
+        self.pos = 0
+        self.eof = not chunk
+        return True
+
+    def peek(self):
+        """
+            Skip the whitespaces.
+            :return: str - the next character, "" at the end of the file.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACES:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        """
+            Consume the next character, which must be one of chars.
+            :return: str - the character.
+        """
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("Expected one of {} at {}".format(chars, repr(c)))
+        self.pos += 1
+        return c
+
+    def value(self):
+        """
+            Decode the next JSON value, reading more of the file
+            until it is complete.
+            :return: the decoded value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+                # A number can be cut at the end of the buffer (e.g. "1."
+                # then "5e10"): it must be followed by something else.
+                tail = end
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    while tail < len(self.buffer) and self.buffer[tail] in NUMBER_CHARS:
+                        tail += 1
+                if tail < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_items(f, keys):
+    """
+        Parse a JSON object {key: [items], ...} and yield the items
+        of the arrays of the given keys. Other members are skipped.
+        :return: generator of (key, item) tuples.
+    """
+    reader = Reader(f)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key in keys and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield key, reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            reader.value()
+        if reader.expect(",}") == "}":
+            return
+
+
+def iter_lines(f, key):
+    """
+        Parse a NDJSON file, each line being an item.
+        :return: generator of (key, item) tuples.
+    """
+    reader = Reader(f)
+    while reader.peek():
+        yield key, reader.value()
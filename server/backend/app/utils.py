@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import yaml
+import json
 import sys
 import os
 from functools import reduce
@@ -33,3 +34,73 @@ def write_config(cat, key, value):
             return True
     except:
         return False
+
+
+def page_args(args, max_limit):
+    """
+        Read the keyset pagination arguments of a request: the id
+        after which the page starts and the size of the page.
+        :return: tuple (after_id or None, limit)
+    """
+    try:
+        after_id = int(args["after_id"]) if "after_id" in args else None
+    except ValueError:
+        after_id = 0
+    try:
+        limit = min(max(int(args.get("limit", max_limit)), 1), max_limit)
+    except ValueError:
+        limit = max_limit
+    return after_id, limit
+
+
+def stream_export(key, records, ndjson=False, chunk_size=500):
+    """
+        Serialize records, chunk_size at a time, as a JSON document
+        {key: [...]} or as NDJSON (one record per line).
+        :return: generator of str chunks.
+    """
+    sep = "\n" if ndjson else ", "
+    buffer, first = [], True
+    if not ndjson:
+        yield '{"%s": [' % key
+    for record in records:
+        buffer.append(json.dumps(record))
+        if len(buffer) == chunk_size:
+            yield ("" if first or ndjson else sep) + sep.join(buffer) + ("\n" if ndjson else "")
+            buffer, first = [], False
+    if buffer:
+        yield ("" if first or ndjson else sep) + sep.join(buffer) + ("\n" if ndjson else "")
+    if not ndjson:
+        yield "]}"
+
+
+def serve(app, host, port, workers=1, threads=1, ssl_context=None, post_fork=None):
+    """
+        Serve the application with gunicorn: workers processes,
+        each one answering threads requests at a time. The application
+        is loaded before the workers are forked, so they share its
+        state at startup. A SIGHUP gracefully replaces the workers.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    options = {"bind": "{}:{}".format(host, port),
+               "workers": workers,
+               "threads": threads,
+               "worker_class": "gthread",
+               "preload_app": True,
+               "timeout": 120,
+               "graceful_timeout": 30}
+    if ssl_context:
+        options["certfile"], options["keyfile"] = ssl_context
+    if post_fork:
+        options["post_fork"] = post_fork
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from app.definitions import definitions
+import re
+
+"""
+    Validation and type detection of the IOCs and whitelisted
+    elements. The patterns of the definitions are compiled once and
+    a value is only matched against a pattern if its shape allows it
+    (cheap checks on its characters and length). When a type is
+    deduced, the first matching type of the definitions wins.
+"""
+
+DIGITS = frozenset("0123456789")
+
+patterns = {kind: {t["type"]: re.compile(t["regex"]) for t in definitions[kind] if t["regex"]}
+            for kind in ["iocs_types", "whitelist_types"]}
+auto_types = {kind: [t["type"] for t in definitions[kind] if t["regex"] and t["auto"]]
+              for kind in ["iocs_types", "whitelist_types"]}
+all_types = {kind: set(t["type"] for t in definitions[kind])
+             for kind in ["iocs_types", "whitelist_types"]}
+
+# Shape of the values of each type, checked before their pattern.
+shapes = {"ip4addr": lambda v: v[:1] in DIGITS,
+          "cidr": lambda v: v[:1] in DIGITS,
+          "ip6addr": lambda v: ":" in v,
+          "sha1cert": lambda v: len(v) == 40,
+          "domain": lambda v: "." in v,
+          "ns": lambda v: "." in v,
+          "freedns": lambda v: "." in v,
+          "tld": lambda v: v[:1] == "."}
+
+
+def match(kind, type, value):
+    """
+        Check a value against a type of the definitions.
+        :return: bool
+    """
+    if type == "snort":
+        return value[0:6] == "alert "
+    elif type in patterns[kind]:
+        shape = shapes.get(type)
+        if shape is not None and not shape(value):
+            return False
+        return patterns[kind][type].match(value) is not None
+    return False
+
+
+def classify(kind, value):
+    """
+        Deduce the type of a value.
+        :return: str - the first matching type, or None.
+    """
+    for type in auto_types[kind]:
+        if match(kind, type, value):
+            return type
+    return None
+
+
+def classify_many(kind, values):
+    """
+        Deduce the types of a list of values. The values are split
+        by shape so that each one is only tested against the types
+        it can be.
+        :return: list of types (None for the invalid values).
+    """
+    types = auto_types[kind]
+    numeric = [(t, patterns[kind][t]) for t in types if t in ["ip4addr", "cidr"]]
+    ip6 = [(t, patterns[kind][t]) for t in types if t == "ip6addr"]
+    others = [(t, patterns[kind][t]) for t in types if t not in ["ip4addr", "cidr", "ip6addr"]]
+    numeric += others
+    results = []
+    for value in values:
+        if not value:
+            candidates = []
+        elif ":" in value:
+            candidates = ip6
+        elif value[0] in DIGITS and "." in value:
+            candidates = numeric
+        else:
+            candidates = others
+        results.append(next((t for t, p in candidates
+                             if (t not in shapes or shapes[t](value)) and p.match(value)), None))
+    return results
+
+
+def validate(kind, type, value):
+    """
+        Check a value against its type, deducing it if unknown.
+        :return: tuple (type, bool - validity)
+    """
+    if type == "unknown":
+        deduced = classify(kind, value)
+        return (deduced, True) if deduced else (type, False)
+    elif type in all_types[kind]:
+        return type, match(kind, type, value)
+    return type, False
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from app.definitions import definitions
+from app.validation import validate, classify_many
+import statistics
+import platform
+import argparse
+import random
+import json
+import time
+import re
+
+"""
+    This file benchmarks the validation of the IOCs done during the
+    bulk imports (watchers, MISP, add_bulk) against a synthetic corpus
+    of IOCs, with their type given or to deduce. The regex cascade of
+    the definitions, as it was done before the validation module, is
+    timed as a reference.
+
+    Usage: benchmark.py [--iocs 10000,100000] [--repeat 3] [-o results.json]
+"""
+
+
+def random_ioc(rnd):
+    """
+        Generate an IOC (type, value) of a random type.
+    """
+    t = rnd.choice(["ip4addr", "ip4addr", "ip6addr", "cidr", "domain", "domain",
+                    "domain", "sha1cert", "invalid"])
+    if t == "ip4addr":
+        v = ".".join(str(rnd.randint(0, 255)) for _ in range(4))
+    elif t == "ip6addr":
+        v = ":".join("{:x}".format(rnd.randint(0, 65535)) for _ in range(8))
+    elif t == "cidr":
+        v = "{}/{}".format(".".join(str(rnd.randint(0, 255)) for _ in range(4)), rnd.choice([8, 16, 24]))
+    elif t == "sha1cert":
+        v = "".join(rnd.choice("0123456789abcdef") for _ in range(40))
+    elif t == "domain":
+        v = ".".join("".join(rnd.choice("abcdefghijklmnopqrstuvwxyz0123456789")
+                             for _ in range(rnd.randint(3, 12))) for _ in range(rnd.randint(2, 3))) + ".com"
+    else:
+        v = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz_/ ") for _ in range(rnd.randint(5, 30)))
+    return t, v
+
+
+def regex_cascade(ioc_type, ioc_value):
+    """
+        Reference: validation with the uncompiled regexes of the
+        definitions, trying every type when unknown.
+    """
+    if ioc_type == "unknown":
+        valid = False
+        for t in definitions["iocs_types"]:
+            if t["regex"] and t["auto"]:
+                if re.match(t["regex"], ioc_value):
+                    ioc_type, valid = t["type"], True
+        return ioc_type, valid
+    for t in definitions["iocs_types"]:
+        if t["type"] == ioc_type and t["regex"]:
+            return ioc_type, re.match(t["regex"], ioc_value) is not None
+    return ioc_type, False
+
+
+def measure(function, repeat):
+    """
+        Time a function.
+        :return: dict - the min, median and mean times.
+    """
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t)
+    return {"min": round(min(times), 6),
+            "median": round(statistics.median(times), 6),
+            "mean": round(statistics.mean(times), 6)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the IOCs validation.")
+    parser.add_argument("--iocs", default="10000,100000",
+                        help="comma separated numbers of IOCs (default: 10000,100000)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per scale (default: 3)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default="benchmark-validation.json",
+                        help="results file (default: benchmark-validation.json)")
+    args = parser.parse_args()
+
+    results = {"date": int(time.time()),
+               "python": platform.python_version(),
+               "machine": platform.machine(),
+               "repeat": args.repeat,
+               "results": []}
+
+    for nb_iocs in [int(n) for n in args.iocs.split(",")]:
+        rnd = random.Random(args.seed)
+        iocs = [random_ioc(rnd) for _ in range(nb_iocs)]
+        values = [v for _, v in iocs]
+
+        stages = {
+            "regex_typed": measure(lambda: [regex_cascade(t, v) for t, v in iocs], args.repeat),
+            "validate_typed": measure(lambda: [validate("iocs_types", t, v) for t, v in iocs], args.repeat),
+            "regex_unknown": measure(lambda: [regex_cascade("unknown", v) for v in values], args.repeat),
+            "validate_unknown": measure(lambda: [validate("iocs_types", "unknown", v) for v in values], args.repeat),
+            "classify_many": measure(lambda: classify_many("iocs_types", values), args.repeat)}
+
+        results["results"].append({"iocs": nb_iocs, "stages": stages})
+        print("{} IOCs".format(nb_iocs))
+        for stage, t in stages.items():
+            print("    {:<18} {:.4f}s ({:.0f} IOCs/s)".format(stage, t["median"], nb_iocs / t["median"]))
+
+    with open(args.output, "w") as f:
+        f.write(json.dumps(results, indent=4, separators=(',', ': ')))
+    print("Results written in {}".format(args.output))
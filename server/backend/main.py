@@ -7,11 +7,13 @@ from app.blueprints.ioc import ioc_bp
 from app.blueprints.whitelist import whitelist_bp
 from app.blueprints.config import config_bp
 from app.blueprints.misp import misp_bp
+from app.blueprints.watchers import watchers_bp
 import datetime
 import secrets
 import jwt
 from OpenSSL import SSL
-from app.utils import read_config
+from app.utils import read_config, serve
+from app import db
 from sys import path
 
 app = Flask(__name__, template_folder="../../app/backend/dist")
@@ -48,6 +50,14 @@ def get_file(p, path):
     return send_from_directory(rp, path) if p in ["css", "fonts", "js", "img"] else redirect("/")
 
 
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """
+        Give back the DB connection of the request to the pool.
+    """
+    db.session.remove()
+
+
 @app.errorhandler(404)
 def page_not_found(e):
     return redirect("/")
@@ -58,13 +68,19 @@ app.register_blueprint(ioc_bp, url_prefix='/api/ioc')
 app.register_blueprint(whitelist_bp, url_prefix='/api/whitelist')
 app.register_blueprint(config_bp, url_prefix='/api/config')
 app.register_blueprint(misp_bp, url_prefix='/api/misp')
+app.register_blueprint(watchers_bp, url_prefix='/api/watchers')
 
 if __name__ == '__main__':
     ssl_cert = "{}/{}".format(path[0], 'cert.pem')
     ssl_key = "{}/{}".format(path[0], 'key.pem')
+    host = "0.0.0.0" if read_config(("backend", "remote_access")) else "127.0.0.1"
 
-    if read_config(("backend", "remote_access")):
-        app.run(host="0.0.0.0", port=443,
-                ssl_context=(ssl_cert, ssl_key))
+    if read_config(("backend", "server")) == "gunicorn":
+        # The workers get their own connections to the database.
+        serve(app, host, 443,
+              workers=read_config(("backend", "workers")) or 2,
+              threads=read_config(("backend", "threads")) or 4,
+              ssl_context=(ssl_cert, ssl_key),
+              post_fork=lambda server, worker: db.engine.dispose())
     else:
-        app.run(port=443, ssl_context=(ssl_cert, ssl_key))
+        app.run(host=host, port=443, ssl_context=(ssl_cert, ssl_key))
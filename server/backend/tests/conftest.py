@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import tempfile
+import pytest
+import sqlite3
+import shutil
+import sys
+import os
+
+"""
+    The backend finds config.yaml and tinycheck.sqlite3 two levels
+    above sys.path[0] (/usr/share/tinycheck/server/backend). It is
+    pointed to a temporary install, holding a copy of the configuration
+    and a new database created from the scheme, when the app package
+    is imported here and during the tests, as pytest puts the test
+    directories first in sys.path.
+"""
+
+backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+root = os.path.dirname(os.path.dirname(backend))
+
+install = tempfile.mkdtemp(prefix="tinycheck-tests-")
+os.makedirs(os.path.join(install, "server", "backend"))
+shutil.copy(os.path.join(root, "config.yaml"), install)
+
+conn = sqlite3.connect(os.path.join(install, "tinycheck.sqlite3"))
+with open(os.path.join(root, "assets", "scheme.sql"), "r") as f:
+    conn.executescript(f.read())
+conn.close()
+
+sys.path[0:0] = [os.path.join(install, "server", "backend"), backend]
+import app.db.models
+
+
+@pytest.fixture(autouse=True)
+def tinycheck_install(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.join(install, "server", "backend"))
+    return install
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(install, ignore_errors=True)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from app.classes.config import Config
+from app.db.migrations import upgrade
+from unittest import mock
+import tempfile
+import unittest
+import sqlite3
+import shutil
+import os
+
+"""
+    Tests of the merge of an imported database: the rows already known
+    are skipped, through indexed lookups (checked with the query plans
+    of the statements run by the merge).
+"""
+
+scheme = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "assets", "scheme.sql")
+
+
+class TestMergeDB(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.dir, "tinycheck.sqlite3")
+        self.src_path = os.path.join(self.dir, "import.sqlite3")
+        for path, start in [(self.db_path, 0), (self.src_path, 500)]:
+            conn = sqlite3.connect(path)
+            with open(scheme, "r") as f:
+                conn.executescript(f.read())
+            conn.executemany("INSERT INTO iocs (value, type, tlp, tag, source, added_on) VALUES (?, 'domain', 'white', 'tracker', 'test', 0)",
+                             [("ioc{}.com".format(i),) for i in range(start, start + 1000)])
+            conn.executemany("INSERT INTO whitelist (element, type, source, added_on) VALUES (?, 'domain', 'test', 0)",
+                             [("white{}.com".format(i),) for i in range(start, start + 1000)])
+            conn.commit()
+            conn.close()
+        upgrade(self.db_path)
+
+        # Whitelisted with another type in the imported database.
+        conn = sqlite3.connect(self.src_path)
+        conn.execute("UPDATE whitelist SET type = 'freedns' WHERE element = 'white500.com'")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def merge(self):
+        """
+            Merge the databases, recording the statements of the merge.
+        """
+        statements, connect = [], sqlite3.connect
+
+        def traced_connect(*args, **kwargs):
+            conn = connect(*args, **kwargs)
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        with mock.patch("sqlite3.connect", traced_connect):
+            result = Config().merge_db(self.db_path, self.src_path)
+        # The statement is traced again for each run of the FTS triggers.
+        return result, list(dict.fromkeys(s for s in statements if s.startswith("INSERT") and "FROM src." in s))
+
+    def test_merge(self):
+        result, _ = self.merge()
+        self.assertEqual((result["iocs"], result["iocs_skipped"]), (500, 500))
+        self.assertEqual((result["elements"], result["elements_skipped"]), (500, 500))
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM whitelist").fetchone()[0], 1500)
+        self.assertEqual(conn.execute("SELECT type FROM whitelist WHERE element = 'white500.com'").fetchone()[0], "domain")
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM iocs WHERE source = 'import-test'").fetchone()[0], 500)
+        conn.close()
+
+    def test_query_plans(self):
+        _, statements = self.merge()
+        self.assertEqual(len(statements), 2)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("ATTACH DATABASE ? AS src", (self.src_path,))
+        for statement in statements:
+            plan = [r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + statement)]
+            lookups = [p for p in plan if " m " in p + " "]
+            self.assertTrue(lookups, plan)
+            for p in lookups:
+                self.assertTrue(p.startswith("SEARCH m USING"), plan)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from app import jsonstream
+from app.jsonstream import iter_items, iter_lines
+import unittest
+import gzip
+import json
+import io
+
+"""
+    Tests of the incremental parsing of the feeds: whatever the size
+    of the chunks, the items must be the ones of the whole document.
+"""
+
+ITEMS = [{"type": "domain", "value": "exämple.com", "tlp": "white", "score": 1.5e10},
+         {"type": "ip4addr", "value": "10.0.0.1", "score": -12, "ratio": 0.25},
+         {"type": "sha1cert", "value": "ab" * 20, "tags": ["a", "ü"], "seen": True, "meta": None},
+         12345, -1.5e-3, 7, "√ 2", [1, 2.5, {"n": 100}], 0]
+
+
+class TestJsonStream(unittest.TestCase):
+
+    def setUp(self):
+        self.chunk_size = jsonstream.CHUNK_SIZE
+
+    def tearDown(self):
+        jsonstream.CHUNK_SIZE = self.chunk_size
+
+    def parse(self, parser, content, *args):
+        """
+            Parse the content with every chunk size, from 1 byte
+            to the size of the content.
+            :return: list of the results, one by chunk size.
+        """
+        results = []
+        for size in range(1, len(content) + 1):
+            jsonstream.CHUNK_SIZE = size
+            results.append(list(parser(jsonstream.open_feed(io.BytesIO(content)), *args)))
+        return results
+
+    def test_chunks(self):
+        content = json.dumps({"version": 2.0, "iocs": ITEMS, "count": 9, "to_delete": [1.25]},
+                             ensure_ascii=False).encode()
+        expected = [("iocs", i) for i in ITEMS] + [("to_delete", 1.25)]
+        for result in self.parse(iter_items, content, ["iocs", "to_delete"]):
+            self.assertEqual(result, expected)
+
+    def test_chunks_ndjson(self):
+        content = "\n".join(json.dumps(i, ensure_ascii=False) for i in ITEMS).encode()
+        for result in self.parse(iter_lines, content, "iocs"):
+            self.assertEqual(result, [("iocs", i) for i in ITEMS])
+
+    def test_gzip(self):
+        content = gzip.compress(json.dumps({"iocs": ITEMS}).encode())
+        jsonstream.CHUNK_SIZE = 7
+        self.assertEqual(list(iter_items(jsonstream.open_feed(io.BytesIO(content)), ["iocs"])),
+                         [("iocs", i) for i in ITEMS])
+
+    def test_truncated(self):
+        content = json.dumps({"iocs": ITEMS}).encode()[:-10]
+        for size in [1, 5, len(content)]:
+            jsonstream.CHUNK_SIZE = size
+            with self.assertRaises(ValueError):
+                list(iter_items(jsonstream.open_feed(io.BytesIO(content)), ["iocs"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
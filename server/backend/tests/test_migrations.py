@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import importlib.util
+import tempfile
+import unittest
+import sqlite3
+import shutil
+import os
+
+"""
+    Tests of the database migrations: an old database (created from
+    the scheme, without indexes) is upgraded in place and the query plans of
+    the lookups must use the new indexes. The migrations module is
+    loaded from its file, as importing app.db opens tinycheck.sqlite3.
+"""
+
+backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+scheme = os.path.join(backend, "..", "..", "assets", "scheme.sql")
+
+spec = importlib.util.spec_from_file_location(
+    "migrations", os.path.join(backend, "app", "db", "migrations.py"))
+migrations = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(migrations)
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.dir, "tinycheck.sqlite3")
+        conn = sqlite3.connect(self.db_path)
+        with open(scheme, "r") as f:
+            conn.executescript(f.read())
+        conn.executemany("INSERT INTO iocs (value, type, tlp, tag, source, added_on) VALUES (?, ?, 'white', 'tracker', 'test', 0)",
+                         [("Example{}.com".format(i), "domain") for i in range(200)] +
+                         [("10.0.0.{}".format(i), "ip4addr") for i in range(50)] +
+                         [("example0.com", "domain")])
+        conn.executemany("INSERT INTO whitelist (element, type, source, added_on) VALUES (?, ?, 'test', 0)",
+                         [("white{}.com".format(i), "domain") for i in range(200)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_case_duplicates(self):
+        # The unique index created by an older scheme.sql, piped into
+        # the existing databases by update.sh.
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE UNIQUE INDEX iocs_value ON iocs(value)")
+        conn.executemany("INSERT INTO iocs (value, type, tlp, tag, source, added_on) VALUES (?, ?, 'white', 'tracker', 'test', 0)",
+                         [("example1.COM", "domain"), ("EXAMPLE1.com", "domain"), ("Snort", "snort"), ("snort", "snort")])
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(migrations.upgrade(self.db_path), len(migrations.migrations))
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual([v for v, in conn.execute("SELECT value FROM iocs WHERE value LIKE 'example1.com'")],
+                         ["example1.com"])
+        self.assertEqual(sorted(v for v, in conn.execute("SELECT value FROM iocs WHERE type = 'snort'")),
+                         ["Snort", "snort"])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM iocs").fetchone()[0], 252)
+        conn.close()
+
+    def query_plan(self, sql, params):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("ANALYZE")
+            return " / ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        finally:
+            conn.close()
+
+    def test_upgrade(self):
+        self.assertEqual(migrations.upgrade(self.db_path), len(migrations.migrations))
+        conn = sqlite3.connect(self.db_path)
+        values = [v for v, in conn.execute("SELECT value FROM iocs WHERE value LIKE 'example0.com'")]
+        conn.close()
+        self.assertEqual(values, ["example0.com"])
+        # Already upgraded, nothing to do.
+        self.assertEqual(migrations.upgrade(self.db_path), len(migrations.migrations))
+
+    def test_query_plans(self):
+        migrations.upgrade(self.db_path)
+
+        # analysis/utils.get_iocs
+        plan = self.query_plan("SELECT value, tag FROM iocs WHERE type = ? ORDER BY value", ("domain",))
+        self.assertIn("USING COVERING INDEX iocs_type_value", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+        # analysis/utils.get_whitelist
+        plan = self.query_plan("SELECT element FROM whitelist WHERE type = ? ORDER BY element", ("domain",))
+        self.assertIn("USING COVERING INDEX whitelist_type_element", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+        # IOCs.add / IOCs.delete_by_value, exists() by value
+        plan = self.query_plan("SELECT EXISTS (SELECT 1 FROM iocs WHERE value = ?)", ("example0.com",))
+        self.assertIn("USING COVERING INDEX iocs_value", plan)
+
+    @unittest.skipIf(sqlite3.sqlite_version_info < (3, 34, 0), "no trigram tokenizer")
+    def test_fts_retried(self):
+        migrations.sqlite3 = type("sqlite3", (), {"connect": sqlite3.connect,
+                                                  "sqlite_version_info": (3, 31, 1)})
+        try:
+            migrations.upgrade(self.db_path)
+        finally:
+            migrations.sqlite3 = sqlite3
+        conn = sqlite3.connect(self.db_path)
+        self.assertIsNone(conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'iocs_fts'").fetchone())
+        conn.close()
+
+        # Once SQLite upgraded, the FTS tables are created at startup.
+        migrations.upgrade(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        self.assertIsNotNone(conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'iocs_fts'").fetchone())
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM iocs_fts WHERE iocs_fts MATCH '\"example1\"'").fetchone()[0], 111)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
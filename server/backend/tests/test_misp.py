@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from app import db
+from app.db.models import MISPInst, Ioc
+from app.classes.misp import MISP
+import watchers
+import threading
+import unittest
+import pymisp
+import json
+import time
+
+"""
+    Tests of the synchronization of the MISP instances by pages,
+    against a local HTTP server answering as a MISP instance.
+"""
+
+
+class MISPHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.startswith("/servers/getPyMISPVersion"):
+            self.answer(200, {"version": pymisp.__version__})
+        elif self.path.startswith("/servers/getVersion"):
+            self.answer(200, {"version": "2.4.180"})
+        elif self.path.startswith("/users/view/me"):
+            self.answer(200, {"User": {"id": "1", "email": "admin@admin.test"},
+                              "Role": {"id": "1", "name": "admin"},
+                              "UserSetting": {}})
+        else:
+            self.answer(404, {"errors": "Not found"})
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        server.searches.append(query)
+        if query["page"] == server.failing_page:
+            return self.answer(500, {"errors": "Internal error"})
+        start = (query["page"] - 1) * query["limit"]
+        self.answer(200, {"response": {"Attribute": server.attributes[start:start + query["limit"]]}})
+
+    def answer(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MISPServer(ThreadingHTTPServer):
+
+    def __init__(self, nb_attributes):
+        super().__init__(("127.0.0.1", 0), MISPHandler)
+        self.searches = []
+        self.failing_page = None
+        self.attributes = [{"type": "domain", "category": "Network activity",
+                            "value": "misp{}.port{}.com".format(i, self.server_address[1]),
+                            "Tag": [{"name": "tlp:green"}]} for i in range(nb_attributes)]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+
+class TestSyncInstance(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MISPServer(2500)
+        self.last_sync = int(time.time()) - 86400
+        misp = MISPInst("test", self.server.url, "apikey", False, self.last_sync, self.last_sync)
+        db.session.add(misp)
+        db.session.commit()
+        self.misp_id = misp.id
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.query(MISPInst).filter_by(id=self.misp_id).delete()
+        db.session.commit()
+        db.session.remove()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_state(self):
+        last_sync = MISPInst.query.get(self.misp_id).last_sync
+        iocs = db.session.query(Ioc).filter(Ioc.source == "misp-{}".format(self.misp_id)).count()
+        db.session.remove()
+        return last_sync, iocs
+
+    def test_paging(self):
+        start = int(time.time())
+        result = MISP().sync_instance(self.misp_id, page_size=1000)
+        self.assertTrue(result["status"])
+        self.assertEqual((result["pages"], result["attributes"], result["added"]), (3, 2500, 2500))
+        self.assertEqual([s["page"] for s in self.server.searches], [1, 2, 3])
+        self.assertEqual(set(s["limit"] for s in self.server.searches), {1000})
+        self.assertEqual(set(s["from"] for s in self.server.searches), {self.last_sync})
+
+        last_sync, iocs = self.get_state()
+        self.assertGreaterEqual(last_sync, start)
+        self.assertEqual(iocs, 2500)
+
+    def test_failing_page(self):
+        self.server.failing_page = 2
+        result = MISP().sync_instance(self.misp_id, page_size=1000)
+        self.assertFalse(result["status"])
+        self.assertEqual(result["added"], 1000)
+
+        # The committed page is kept, the date of the last sync doesn't move.
+        last_sync, iocs = self.get_state()
+        self.assertEqual(last_sync, self.last_sync)
+        self.assertEqual(iocs, 1000)
+
+        # So the next synchronization fetches the same attributes again.
+        self.server.failing_page = None
+        del self.server.searches[:]
+        result = MISP().sync_instance(self.misp_id, page_size=1000)
+        self.assertTrue(result["status"])
+        self.assertEqual((result["added"], result["exists"]), (1500, 1000))
+        self.assertEqual(set(s["from"] for s in self.server.searches), {self.last_sync})
+        self.assertGreater(self.get_state()[0], self.last_sync)
+
+    def test_scheduled(self):
+        self.assertIn(("misp", self.misp_id), watchers.configured_feeds())
+        result = watchers.run_feed(None, self.misp_id, "misp")
+        self.assertTrue(result["status"])
+        self.assertEqual(result["items"], 2500)
+
+
+if __name__ == "__main__":
+    unittest.main()
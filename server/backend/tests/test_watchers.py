@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from sqlalchemy import event
+from app import db
+from app.db.models import Ioc, Whitelist
+import watchers
+import threading
+import unittest
+import json
+
+"""
+    Tests of the synchronization of the feeds by the watchers, against
+    a local HTTP server answering the conditional requests.
+"""
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        # If-None-Match has precedence over If-Modified-Since (RFC 7232).
+        if self.headers.get("If-None-Match", self.headers.get("If-Modified-Since")) in \
+                [server.etag, server.last_modified]:
+            status, body = 304, b""
+        else:
+            status, body = 200, json.dumps(server.feed).encode()
+        server.requests.append(status)
+        self.send_response(status)
+        self.send_header("ETag", server.etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FeedServer(ThreadingHTTPServer):
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FeedHandler)
+        self.requests = []
+        self.publish(self.domains(0, 100), "v1")
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def domains(self, start, end):
+        return ["feed{}.port{}.com".format(i, self.server_address[1]) for i in range(start, end)]
+
+    def publish(self, domains, version, to_delete=[]):
+        self.feed = {"iocs": [{"type": "domain", "tag": "tracker", "tlp": "white", "value": d}
+                              for d in domains],
+                     "elements": [{"type": "domain", "element": d} for d in domains],
+                     "to_delete": [{"value": d, "element": d} for d in to_delete]}
+        self.etag = '"{}"'.format(version)
+        self.last_modified = "Mon, 19 Oct 2026 00:00:{:02d} GMT".format(len(self.requests))
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/iocs.json".format(self.server_address[1])
+
+
+class TestSyncFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FeedServer()
+        self.writes = []
+        event.listen(db.engine, "before_cursor_execute", self.record_write)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self.record_write)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def record_write(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(" ", 1)[0].upper() in ["INSERT", "UPDATE", "DELETE", "REPLACE"]:
+            self.writes.append(statement)
+
+    def source_values(self, server=None, column=Ioc.value):
+        server = server or self.server
+        feed = db.session.execute("SELECT id FROM feeds WHERE url = :url", {"url": server.url}).fetchone()
+        values = set(v for v, in db.session.query(column).filter(
+            column.class_.source == "watcher-{}".format(feed[0])))
+        db.session.remove()
+        return values
+
+    def test_unchanged_feed(self):
+        result = watchers.sync_feed(self.server.url, "iocs")
+        self.assertTrue(result["status"])
+        self.assertEqual(result["added"], 100)
+        self.assertEqual(self.server.requests, [200])
+        self.assertNotEqual(self.writes, [])
+
+        # Not modified: one 304 and no write.
+        del self.writes[:]
+        result = watchers.sync_feed(self.server.url, "iocs")
+        self.assertTrue(result["status"])
+        self.assertEqual(result["message"], "Feed not modified")
+        self.assertEqual(self.server.requests, [200, 304])
+        self.assertEqual(self.writes, [])
+
+    def test_modified_feed(self):
+        watchers.sync_feed(self.server.url, "iocs")
+        self.server.publish(self.server.domains(10, 110), "v2")
+
+        result = watchers.sync_feed(self.server.url, "iocs")
+        self.assertEqual(self.server.requests, [200, 200])
+        self.assertEqual((result["added"], result["deleted"], result["unchanged"]), (10, 10, 90))
+        self.assertEqual(self.source_values(), set(self.server.domains(10, 110)))
+
+    def test_whitelist_to_delete(self):
+        watchers.sync_feed(self.server.url, "whitelists")
+        self.assertEqual(self.source_values(column=Whitelist.element), set(self.server.domains(0, 100)))
+
+        # Removed by another feed, whatever the case of the element.
+        other = FeedServer()
+        self.addCleanup(other.server_close)
+        self.addCleanup(other.shutdown)
+        other.publish(other.domains(0, 10), "v1", [d.upper() for d in self.server.domains(0, 5)])
+        result = watchers.sync_feed(other.url, "whitelists")
+        self.assertEqual((result["added"], result["deleted"]), (10, 5))
+        self.assertEqual(self.source_values(column=Whitelist.element), set(self.server.domains(5, 100)))
+
+
+if __name__ == "__main__":
+    unittest.main()
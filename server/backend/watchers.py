@@ -1,149 +1,226 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from app import db
 from app.utils import read_config
 from app.classes.iocs import IOCs
 from app.classes.whitelist import WhiteList
+from app.classes.feeds import Feeds
 from app.classes.misp import MISP
+from app.db.models import MISPInst
+from app.jsonstream import iter_items, iter_lines, open_feed, CHUNK_SIZE
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 import requests
-import json
+import tempfile
+import random
 import urllib3
 import time
-from multiprocessing import Process
 
 """
     This file is parsing the watchers present
     in the configuration file. This in order to get
     automatically new iocs / elements from remote
-    sources without user interaction.
+    sources without user interaction. The feeds and
+    the MISP instances are refreshed periodically,
+    several at a time.
 """
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def watch_iocs():
+def feed_items(items, key, to_delete):
     """
-        Retrieve IOCs from the remote URLs defined in config/watchers.
-        For each IOC, add it to the DB.
+        Route the items parsed from a feed: the items of key are
+        yielded, the items to delete are collected in to_delete.
+        An empty feed is rejected, as it would empty its source.
+        :return: generator of the items of key.
     """
-
-    # Retrieve the URLs from the configuration
-    urls = read_config(("watchers", "iocs"))
-    watchers = [{"url": url, "status": False} for url in urls]
-
-    while True:
-        for w in watchers:
-            if w["status"] == False:
-                iocs = IOCs()
-                iocs_list = []
-                to_delete = []
-                try:
-                    res = requests.get(w["url"], verify=False)
-                    if res.status_code == 200:
-                        content = json.loads(res.content)
-                        iocs_list = content["iocs"] if "iocs" in content else []
-                        to_delete = content["to_delete"] if "to_delete" in content else []
-                    else:
-                        w["status"] = False
-                except:
-                    w["status"] = False
-
-                for ioc in iocs_list:
-                    try:
-                        iocs.add(ioc["type"], ioc["tag"],
-                                 ioc["tlp"], ioc["value"], "watcher")
-                        w["status"] = True
-                    except:
-                        continue
-
-                for ioc in to_delete:
-                    try:
-                        iocs.delete_by_value(ioc["value"])
-                        w["status"] = True
-                    except:
-                        continue
-
-        # If at least one URL haven't be parsed, let's retry in 1min.
-        if False in [w["status"] for w in watchers]:
-            time.sleep(60)
+    count = 0
+    for k, item in items:
+        if k == key:
+            count += 1
+            yield item
         else:
-            break
+            to_delete.append(item)
+    if not count:
+        raise ValueError("No {} in the feed".format(key))
 
 
-def watch_whitelists():
+def sync_feed(url, kind, session=requests):
     """
-        Retrieve whitelist elements from the remote URLs
-        defined in config/watchers. For each (new ?) element,
-        add it to the DB.
+        Download a feed (iocs or whitelists) if it changed since its
+        last download, thanks to a conditional request, and make the
+        DB rows attributed to it match its content. The feed is
+        streamed to a temporary file and parsed item by item.
+        :return: dict - status of the synchronization.
     """
-
-    urls = read_config(("watchers", "whitelists"))
-    watchers = [{"url": url, "status": False} for url in urls]
-
-    while True:
-        for w in watchers:
-            if w["status"] == False:
-                whitelist = WhiteList()
-                elements = []
-                to_delete = []
-                try:
-                    res = requests.get(w["url"], verify=False)
-                    if res.status_code == 200:
-                        content = json.loads(res.content)
-                        elements = content["elements"] if "elements" in content else []
-                        to_delete = content["to_delete"] if "to_delete" in content else []
-                    else:
-                        w["status"] = False
-                except:
-                    w["status"] = False
-
-                for elem in elements:
-                    try:
-                        whitelist.add(elem["type"], elem["element"], "watcher")
-                        w["status"] = True
-                    except:
-                        continue
-
-                for elem in to_delete:
-                    try:
-                        whitelist.delete_by_value(elem["element"])
-                        w["status"] = True
-                    except:
-                        continue
-
-        if False in [w["status"] for w in watchers]:
-            time.sleep(60)
-        else:
-            break
-
-
-def watch_misp():
+    key, cls = ("iocs", IOCs) if kind == "iocs" else ("elements", WhiteList)
+    try:
+        feed = Feeds.get(url)
+        headers = {}
+        if feed["etag"]:
+            headers["If-None-Match"] = feed["etag"]
+        if feed["last_modified"]:
+            headers["If-Modified-Since"] = feed["last_modified"]
+
+        with session.get(url, headers=headers, verify=False, timeout=60, stream=True) as res, \
+                tempfile.TemporaryFile() as f:
+            if res.status_code == 304:
+                return {"status": True,
+                        "message": "Feed not modified",
+                        "bytes": 0}
+            elif res.status_code != 200:
+                return {"status": False,
+                        "message": "Unexpected HTTP status {}".format(res.status_code)}
+
+            size = 0
+            for chunk in res.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
+            f.seek(0)
+
+            if url.endswith((".ndjson", ".jsonl")) or "ndjson" in res.headers.get("Content-Type", ""):
+                items = iter_lines(open_feed(f), key)
+            else:
+                items = iter_items(open_feed(f), [key, "to_delete"])
+
+            # Committed with the feed content by the sync.
+            Feeds.update(feed["id"], res.headers.get("ETag"),
+                         res.headers.get("Last-Modified"))
+            to_delete = []
+            result = cls.sync(feed_items(items, key, to_delete), "watcher-{}".format(feed["id"]),
+                              to_delete, legacy_source="watcher")
+            result["bytes"] = size
+            return result
+    except ValueError as e:
+        db.session.rollback()
+        return {"status": False,
+                "message": str(e)}
+    except:
+        db.session.rollback()
+        return {"status": False,
+                "message": "Error while synchronizing the feed"}
+    finally:
+        db.session.remove()
+
+
+def configured_feeds():
+    """
+        List the feeds defined in config/watchers and the MISP
+        instances with their refresh interval (watchers/intervals,
+        by URL or misp-<id>, or watchers/interval).
+        :return: dict - {(kind, url or MISP instance id): interval}
+    """
+    config = read_config(("watchers",)) or {}
+    intervals = config.get("intervals") or {}
+    feeds = {}
+    for kind in ["iocs", "whitelists"]:
+        for url in config.get(kind) or []:
+            feeds[(kind, url)] = intervals.get(url, config.get("interval", 21600))
+    try:
+        for misp_id, in db.session.query(MISPInst.id):
+            feeds[("misp", misp_id)] = intervals.get("misp-{}".format(misp_id),
+                                                     config.get("interval", 21600))
+    finally:
+        db.session.remove()
+    return feeds
+
+
+def run_feed(session, url, kind):
     """
-        Retrieve IOCs from misp instances. Each new element is
-        tested and then added to the database.
+        Synchronize a feed or a MISP instance (url being its id),
+        in a worker thread.
+        :return: dict - status of the synchronization and its duration.
     """
-    iocs, misp = IOCs(), MISP()
-    instances = [i for i in misp.get_instances()]
-
-    while instances:
-        for i, ist in enumerate(instances):
-            status = misp.test_instance(ist["url"],
-                                        ist["apikey"],
-                                        ist["verifycert"])
-            if status:
-                for ioc in misp.get_iocs(ist["id"]):
-                    iocs.add(ioc["type"], ioc["tag"], ioc["tlp"],
-                             ioc["value"], "misp-{}".format(ist["id"]))
-                misp.update_sync(ist["id"])
-                instances.pop(i)
-        if instances: time.sleep(60)
-
-
-p1 = Process(target=watch_iocs)
-p2 = Process(target=watch_whitelists)
-#p3 = Process(target=watch_misp)
-
-p1.start()
-p2.start()
-#p3.start()
+    start = time.time()
+    if kind == "misp":
+        result = MISP().sync_instance(url)
+        if result["status"]:
+            result["message"] = "{} ({} attributes, {} pages, {} attributes/s)".format(
+                result["message"], result["attributes"], result["pages"], result["rate"])
+            result["items"], result["bytes"] = result["attributes"], None
+    else:
+        result = sync_feed(url, kind, session)
+    result["duration"] = round(time.time() - start, 3)
+    return result
+
+
+def schedule():
+    """
+        Refresh the feeds and the MISP instances forever: each one is
+        synchronized when its interval is elapsed, at most
+        watchers/max_workers at a time through a pooled HTTP session.
+        A failing one (e.g. an unreachable instance) is retried with a
+        jittered exponential backoff. The state of the feeds is written
+        for the backend API after each synchronization.
+    """
+    max_workers = read_config(("watchers", "max_workers")) or 4
+    retry_delay = read_config(("watchers", "retry_delay")) or 60
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    feeds, running = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Follow the changes of the configuration.
+            configured = configured_feeds()
+            for key in [k for k in feeds if k not in configured and k not in running.values()]:
+                del feeds[key]
+            for (kind, url), interval in configured.items():
+                feed = feeds.setdefault((kind, url), {"kind": kind, "url": url,
+                                                      "status": None, "message": "",
+                                                      "last_run": None, "last_success": None,
+                                                      "duration": None, "items": None,
+                                                      "bytes": None, "failures": 0,
+                                                      "next_run": 0})
+                feed["interval"] = interval
+
+            now = time.time()
+            for key, feed in feeds.items():
+                if feed["next_run"] <= now and key not in running.values():
+                    running[executor.submit(run_feed, session, feed["url"], feed["kind"])] = key
+
+            # Wait for a synchronization to end or for the next one to start.
+            idle = [f["next_run"] for k, f in feeds.items() if k not in running.values()]
+            timeout = min([60] + [max(1, t - time.time()) for t in idle])
+            if running:
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                done = []
+                time.sleep(timeout)
+
+            for future in done:
+                feed = feeds[running.pop(future)]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Retried with the backoff as any failing synchronization.
+                    result = {"status": False,
+                              "message": "Error while synchronizing: {}".format(e),
+                              "duration": None}
+                feed["status"] = result["status"]
+                feed["message"] = result["message"]
+                feed["last_run"] = int(time.time())
+                feed["duration"] = result["duration"]
+                if result["status"]:
+                    feed["last_success"] = feed["last_run"]
+                    feed["items"] = result.get("items", feed["items"])
+                    feed["bytes"] = result["bytes"]
+                    feed["failures"] = 0
+                    feed["next_run"] = time.time() + feed["interval"]
+                else:
+                    feed["failures"] += 1
+                    delay = min(retry_delay * 2 ** (feed["failures"] - 1), feed["interval"])
+                    feed["next_run"] = time.time() + random.uniform(delay / 2, delay)
+
+            if done:
+                Feeds.write_status(list(feeds.values()))
+
+
+if __name__ == "__main__":
+    schedule()
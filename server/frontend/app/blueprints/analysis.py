@@ -5,7 +5,7 @@ import re
 import os
 import json
 import sys
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, Response
 from app.classes.analysis import Analysis
 import subprocess as sp
 import json
@@ -24,6 +24,25 @@ def api_start_analysis(token):
 @analysis_bp.route("/report/<token>", methods=["GET"])
 def api_report_analysis(token):
     """ 
-        Get the report of an analysis
+        Get the report of an analysis. The report is sent gzipped
+        if accepted, with an ETag so that unchanged polls get a 304.
     """
-    return jsonify(Analysis(token).get_report())
+    report = Analysis(token).get_cached_report()
+    if "gzip" in request.accept_encodings:
+        res = Response(report["gzip"], mimetype="application/json")
+        res.headers["Content-Encoding"] = "gzip"
+        res.set_etag(report["etag"] + "-gzip")
+    else:
+        res = Response(report["body"], mimetype="application/json")
+        res.set_etag(report["etag"])
+    res.vary.add("Accept-Encoding")
+    res.headers["Cache-Control"] = "no-cache"
+    return res.make_conditional(request)
+
+
+@analysis_bp.route("/pdf/<token>", methods=["GET"])
+def api_pdf_analysis(token):
+    """ 
+        Get the PDF report of an analysis
+    """
+    return Analysis(token).get_pdf()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from flask import Blueprint, Response, stream_with_context
+from app.blueprints.capture import capture
+from app.classes.capture import SAMPLE_PERIOD
+from app.classes.analysis import Analysis
+import json
+import time
+import os
+
+events_bp = Blueprint("events", __name__)
+
+# Period of the analysis progress checks, and maximum silence
+# before a keep-alive comment.
+PROGRESS_PERIOD = 0.25
+KEEPALIVE = 15
+# Maximum duration of an analysis stream, so a crashed analysis
+# doesn't hold a serving thread forever.
+ANALYSIS_TIMEOUT = 600
+
+
+def event(name, data):
+    """
+        Format a server-sent event.
+        :return: str
+    """
+    return "event: {}\ndata: {}\n\n".format(name, json.dumps(data))
+
+
+def stream(events):
+    """
+        Send a generator of server-sent events.
+        :return: streamed Response
+    """
+    return Response(stream_with_context(events),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+
+@events_bp.route("/capture", methods=["GET"])
+def api_events_capture():
+    """
+        Push the samples of the capture statistics (packets and bytes
+        since the previous sample, rates) as they are taken (packets),
+        until the capture stops (end).
+    """
+    def events():
+        count, last_event = capture.get_samples(0)[0], time.time()
+        while capture.capturing:
+            count, samples = capture.get_samples(count, SAMPLE_PERIOD * 2)
+            for sample in samples:
+                yield event("packets", dict(sample, delta=sample["packets"]))
+                last_event = time.time()
+            if time.time() - last_event > KEEPALIVE:
+                last_event = time.time()
+                yield ": keep-alive\n\n"
+        yield event("end", {})
+    return stream(events())
+
+
+@events_bp.route("/analysis/<token>", methods=["GET"])
+def api_events_analysis(token):
+    """
+        Push the stages of an analysis as they start (stage), then
+        the report once ready (report). The stream ends with an error
+        if the analysis failed or after ANALYSIS_TIMEOUT.
+    """
+    analysis = Analysis(token)
+    progress = "/tmp/{}/assets/progress.json".format(analysis.token)
+
+    def events():
+        if analysis.token is None:
+            yield event("error", {"message": "Bad token provided"})
+            return
+        start = last_event = time.time()
+        last_mtime = None
+        while time.time() - start < ANALYSIS_TIMEOUT:
+            try:
+                mtime = os.stat(progress).st_mtime_ns
+                if mtime != last_mtime:
+                    with open(progress, "r") as f:
+                        stage = json.load(f)
+                    last_mtime, last_event = mtime, time.time()
+                    yield event("stage", stage)
+                    if stage["stage"] == "failed":
+                        yield event("error", {"message": "The analysis failed"})
+                        return
+            except (OSError, ValueError, KeyError):
+                pass
+
+            report = analysis.get_report()
+            if "message" not in report:
+                yield event("report", report)
+                return
+            if time.time() - last_event > KEEPALIVE:
+                last_event = time.time()
+                yield ": keep-alive\n\n"
+            time.sleep(PROGRESS_PERIOD)
+        yield event("error", {"message": "No report yet"})
+    return stream(events())
@@ -19,3 +19,9 @@ def api_usb_list():
 def api_save_capture(token, method):
     """ Save the capture on the USB or for download """
     return save.save_capture(token, method)
+
+
+@save_bp.route("/progress/<token>", methods=["GET"])
+def api_save_progress(token):
+    """ Get the progress of the saving of a capture """
+    return jsonify(save.get_progress(token))
@@ -2,11 +2,25 @@
 # -*- coding: utf-8 -*-
 
 import subprocess as sp
+from multiprocessing.connection import Client
+from app.utils import read_config
+from collections import OrderedDict
+from flask import send_file, jsonify
+import threading
+import hashlib
 import json
+import gzip
 import sys
 import re
 import os
 
+# Assembled reports of the last analyses, by token, kept as long as
+# the files they are made of are unchanged (same mtimes and sizes).
+REPORT_FILES = ["device", "capinfos", "alerts", "timings"]
+REPORTS_CACHE = 16
+reports = OrderedDict()
+reports_lock = threading.Lock()
+
 
 class Analysis(object):
 
@@ -40,27 +54,108 @@ class Analysis(object):
 
             :return: dict containing the report or error message.
         """
+        return self.get_cached_report()["report"]
+
+    def get_cached_report(self):
+        """
+            Get the report from the cache, assembling it again only if
+            one of its files changed. The serialized report, its gzipped
+            version and its ETag are cached along.
+
+            :return: dict - report, body, gzip and etag.
+        """
+        key = []
+        for name in REPORT_FILES:
+            try:
+                st = os.stat("/tmp/{}/assets/{}.json".format(self.token, name))
+                key.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                key.append(None)
 
-        device, alerts, pcap = {}, {}, {}
+        with reports_lock:
+            entry = reports.get(self.token)
+            if entry is not None and entry["key"] == key:
+                reports.move_to_end(self.token)
+                return entry
 
-        # Getting device configuration.
-        if os.path.isfile("/tmp/{}/assets/device.json".format(self.token)):
-            with open("/tmp/{}/assets/device.json".format(self.token), "r") as f:
-                device = json.load(f)
+        try:
+            report = self.read_report()
+        except ValueError:
+            # A file of the report is being written.
+            report = {"message": "No report yet"}
+            key = None
 
-        # Getting pcap infos.
-        if os.path.isfile("/tmp/{}/assets/capinfos.json".format(self.token)):
-            with open("/tmp/{}/assets/capinfos.json".format(self.token), "r") as f:
-                pcap = json.load(f)
+        body = json.dumps(report).encode()
+        entry = {"key": key,
+                 "report": report,
+                 "body": body,
+                 "gzip": gzip.compress(body, 6),
+                 "etag": hashlib.sha1(body).hexdigest()}
+        if key is not None:
+            with reports_lock:
+                reports[self.token] = entry
+                reports.move_to_end(self.token)
+                while len(reports) > REPORTS_CACHE:
+                    reports.popitem(last=False)
+        return entry
+
+    def read_report(self):
+        """
+            Read the files of the report.
+
+            :return: dict containing the report or error message.
+        """
 
-        # Getting alerts configuration.
-        if os.path.isfile("/tmp/{}/assets/alerts.json".format(self.token)):
-            with open("/tmp/{}/assets/alerts.json".format(self.token), "r") as f:
-                alerts = json.load(f)
+        files = {}
+        for name in REPORT_FILES:
+            if os.path.isfile("/tmp/{}/assets/{}.json".format(self.token, name)):
+                with open("/tmp/{}/assets/{}.json".format(self.token, name), "r") as f:
+                    files[name] = json.load(f)
 
-        if device != {} and alerts != {}:
-            return {"alerts": alerts,
-                    "device": device,
-                    "pcap": pcap}
+        if files.get("device", {}) != {} and files.get("alerts", {}) != {}:
+            return {"alerts": files["alerts"],
+                    "device": files["device"],
+                    "pcap": files.get("capinfos", {}),
+                    "timings": files.get("timings", {})}
         else:
             return {"message": "No report yet"}
+
+    def get_pdf(self):
+        """
+            Get the PDF report of the analysis. The renderer is asked
+            to render it on demand (or to return the cached one) without
+            waiting for it: the client polls again while it is rendering.
+
+            :return: the PDF file or a json status message.
+        """
+        if self.token is None:
+            return jsonify({"status": False,
+                            "message": "Bad token provided"})
+
+        report_pdf = "/tmp/{}/report.pdf".format(self.token)
+
+        try:
+            conn = Client(read_config(("analysis", "renderer_socket")), family="AF_UNIX")
+            try:
+                conn.send_bytes(json.dumps({"capture_directory": "/tmp/{}".format(self.token),
+                                            "poll": True}).encode())
+                res = json.loads(conn.recv_bytes().decode())
+            finally:
+                conn.close()
+            if res.get("rendering"):
+                return jsonify({"status": False,
+                                "message": "Report rendering",
+                                "rendering": True}), 202
+            if res["status"]:
+                report_pdf = res["report"]
+        except:
+            pass
+
+        if os.path.isfile(report_pdf):
+            return send_file(report_pdf,
+                             mimetype="application/pdf",
+                             as_attachment=True,
+                             attachment_filename="TinyCheck_{}.pdf".format(self.token))
+        else:
+            return jsonify({"status": False,
+                            "message": "No report yet"})
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import datetime
+import hashlib
+import struct
+import mmap
+import os
+
+PCAP_MAGICS = {b"\xd4\xc3\xb2\xa1": ("<", 1e6), b"\xa1\xb2\xc3\xd4": (">", 1e6),
+               b"\x4d\x3c\xb2\xa1": ("<", 1e9), b"\xa1\xb2\x3c\x4d": (">", 1e9)}
+PCAPNG_SHB = b"\x0a\x0d\x0d\x0a"
+
+
+class Capinfos(object):
+    """
+        Scanner of the records headers of a pcap or pcapng file,
+        computing the same informations as capinfos. The file is
+        mmap'ed and only the records appended since the previous
+        scan are read, so it can follow a capture in progress.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.offset = 0
+        self.hashed = 0
+        self.read = False
+        self.sha1 = hashlib.sha1()
+        self.sha256 = hashlib.sha256()
+        self.file_type = None
+        self.endian = "<"
+        self.resolution = 1e6
+        self.resolutions = []
+        self.packets = 0
+        self.data_size = 0
+        self.first = None
+        self.last = None
+        self.time_order = True
+
+    def update(self, final=False):
+        """
+            Scan the complete records appended to the file since the
+            previous scan. The final scan hashes the file up to its end,
+            an incomplete last record included.
+            :return: bool - False if the file can't be read.
+        """
+        with self.lock:
+            try:
+                with open(self.path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size == 0:
+                        self.read = True
+                        return True
+                    with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                        if self.file_type is None and not self.read_header(mm, size):
+                            return False
+                        if self.file_type == "pcap":
+                            self.scan_pcap(mm, size)
+                        else:
+                            self.scan_pcapng(mm, size)
+                        self.hash(mm, size if final else self.offset)
+                        self.read = True
+                return True
+            except (OSError, ValueError, struct.error):
+                return False
+
+    def read_header(self, mm, size):
+        """
+            Read the file header to know its format.
+            :return: bool - False if not complete or unknown.
+        """
+        if size >= 24 and mm[0:4] in PCAP_MAGICS:
+            self.endian, self.resolution = PCAP_MAGICS[mm[0:4]]
+            self.file_type = "pcap"
+            self.offset = 24
+            return True
+        elif size >= 12 and mm[0:4] == PCAPNG_SHB:
+            self.endian = "<" if mm[8:12] == b"\x4d\x3c\x2b\x1a" else ">"
+            self.file_type = "pcapng"
+            return True
+        return False
+
+    def packet(self, timestamp, length):
+        """
+            Account a packet.
+        """
+        if self.first is None:
+            self.first = timestamp
+        elif timestamp < self.last:
+            self.time_order = False
+        self.last = timestamp
+        self.packets += 1
+        self.data_size += length
+
+    def scan_pcap(self, mm, size):
+        """
+            Scan the records of a pcap file.
+        """
+        header = struct.Struct(self.endian + "IIII")
+        offset = self.offset
+        while offset + 16 <= size:
+            ts_sec, ts_frac, incl_len, orig_len = header.unpack_from(mm, offset)
+            if offset + 16 + incl_len > size:
+                break
+            self.packet(ts_sec + ts_frac / self.resolution, orig_len)
+            offset += 16 + incl_len
+        self.offset = offset
+
+    def scan_pcapng(self, mm, size):
+        """
+            Scan the blocks of a pcapng file: the interfaces descriptions
+            (for their timestamps resolution) and the packets.
+        """
+        e = self.endian
+        offset = self.offset
+        while offset + 12 <= size:
+            block_type, length = struct.unpack_from(e + "II", mm, offset)
+            if length < 12 or offset + length > size:
+                break
+            if block_type == 0x0A0D0D0A:
+                # A new section: its interfaces are numbered from 0.
+                e = self.endian = "<" if mm[offset + 8:offset + 12] == b"\x4d\x3c\x2b\x1a" else ">"
+                self.resolutions = []
+            elif block_type == 1:
+                self.resolutions.append(self.if_tsresol(mm, offset + 16, offset + length - 4))
+            elif block_type == 6:
+                if_id, ts_high, ts_low, _, orig_len = struct.unpack_from(e + "IIIII", mm, offset + 8)
+                resolution = self.resolutions[if_id] if if_id < len(self.resolutions) else 1e6
+                self.packet(((ts_high << 32) | ts_low) / resolution, orig_len)
+            elif block_type == 2:
+                if_id, _, ts_high, ts_low, _, orig_len = struct.unpack_from(e + "HHIIII", mm, offset + 8)
+                resolution = self.resolutions[if_id] if if_id < len(self.resolutions) else 1e6
+                self.packet(((ts_high << 32) | ts_low) / resolution, orig_len)
+            elif block_type == 3:
+                # Simple packet blocks have no timestamp.
+                self.packets += 1
+                self.data_size += struct.unpack_from(e + "I", mm, offset + 8)[0]
+            offset += length
+        self.offset = offset
+
+    def if_tsresol(self, mm, offset, end):
+        """
+            Read the if_tsresol option of an interface description.
+            :return: float - the number of timestamp units per second.
+        """
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(self.endian + "HH", mm, offset)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                value = mm[offset + 4]
+                return float(2 ** (value & 0x7F)) if value & 0x80 else float(10 ** value)
+            offset += 4 + (length + 3) // 4 * 4
+        return 1e6
+
+    def hash(self, mm, end):
+        """
+            Hash the file up to end.
+        """
+        view = memoryview(mm)
+        try:
+            for start in range(self.hashed, end, 1 << 20):
+                chunk = view[start:min(end, start + (1 << 20))]
+                self.sha1.update(chunk)
+                self.sha256.update(chunk)
+                chunk.release()
+        finally:
+            view.release()
+        self.hashed = max(self.hashed, end)
+
+    def get_infos(self):
+        """
+            Get the informations of the capture, named as by capinfos.
+            :return: dict
+        """
+        with self.lock:
+            duration = (self.last - self.first) if self.packets and self.first is not None else 0
+            infos = {"File name": self.path,
+                     "File type": "Wireshark/... - pcapng" if self.file_type == "pcapng"
+                                  else "Wireshark/tcpdump/... - pcap",
+                     "Number of packets": str(self.packets),
+                     "File size": "{} bytes".format(self.hashed),
+                     "Data size": "{} bytes".format(self.data_size),
+                     "Capture duration": "{:.6f} seconds".format(duration),
+                     "Average packet size": "{:.2f} bytes".format(
+                         self.data_size / self.packets if self.packets else 0),
+                     "First packet time": "n/a",
+                     "Last packet time": "n/a",
+                     "Strict time order": "True" if self.time_order else "False"}
+            # Hashes of the file only if it has been read.
+            if self.read:
+                infos["SHA256"] = self.sha256.hexdigest()
+                infos["SHA1"] = self.sha1.hexdigest()
+            if self.first is not None:
+                infos["First packet time"] = self.format_time(self.first)
+                infos["Last packet time"] = self.format_time(self.last)
+            if duration > 0:
+                infos["Data byte rate"] = "{:.2f} bytes/s".format(self.data_size / duration)
+                infos["Data bit rate"] = "{:.2f} bits/s".format(self.data_size * 8 / duration)
+                infos["Average packet rate"] = "{:.2f} packets/s".format(self.packets / duration)
+            return infos
+
+    @staticmethod
+    def format_time(timestamp):
+        """
+            Format a timestamp as capinfos does.
+            :return: str
+        """
+        return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S,%f")
@@ -3,20 +3,35 @@
 
 import subprocess as sp
 from app.utils import terminate_process, read_config
+from app.classes.capinfos import Capinfos
 from os import mkdir, path
 from flask import send_file, jsonify
+from collections import deque
+import threading
 import datetime
+import time
 import shutil
 import json
 import random
 import sys
 import re
 
+# Period of the capture statistics samples and number of samples kept.
+SAMPLE_PERIOD = 0.5
+SAMPLES = 400
+# Period of the scans of the capture file.
+SCAN_PERIOD = 2
+
 
 class Capture(object):
 
     def __init__(self):
         self.random_choice_alphabet = "ABCDEF1234567890"
+        self.capturing = False
+        self.capture_token = None
+        self.samples = deque(maxlen=SAMPLES)
+        self.sample_count = 0
+        self.new_sample = threading.Condition()
 
     def start_capture(self):
         """
@@ -36,18 +51,21 @@ class Capture(object):
         self.assets_dir = "/tmp/{}/assets/".format(self.capture_token)
         self.pcap = self.capture_dir + "capture.pcap"
         self.iface = read_config(("network", "in"))
-
-        # For packets monitoring
-        self.list_pkts = []
-        self.last_pkts = 0
+        self.capinfos = Capinfos(self.pcap)
 
         # Make the capture and the assets directory
         mkdir(self.capture_dir)
         mkdir(self.assets_dir)
 
         try:
-            sp.Popen(["tshark",  "-i", self.iface, "-w",
-                      self.pcap, "-f", "tcp or udp"])
+            self.tshark = sp.Popen(["tshark",  "-i", self.iface, "-w",
+                                    self.pcap, "-f", "tcp or udp"])
+            with self.new_sample:
+                self.samples.clear()
+                self.sample_count = 0
+            self.capturing = True
+            threading.Thread(target=self.sample_stats, args=(self.capture_token,),
+                             daemon=True).start()
             return {"status": True,
                     "message": "Capture started",
                     "capture_token": self.capture_token}
@@ -55,40 +73,88 @@ class Capture(object):
             return {"status": False,
                     "message": "Unexpected error: %s" % sys.exc_info()[0]}
 
+    def sample_stats(self, token):
+        """
+            Sample the packets and bytes sent and received by the
+            interface every SAMPLE_PERIOD seconds, while the capture
+            runs. The last SAMPLES samples are kept, with the rates
+            computed from the real time elapsed between them. The
+            capture file is scanned every SCAN_PERIOD seconds.
+        """
+        try:
+            last, last_time = self.read_counters(), time.monotonic()
+            next_time, next_scan = last_time, last_time + SCAN_PERIOD
+            while self.capturing and self.capture_token == token:
+                next_time += SAMPLE_PERIOD
+                time.sleep(max(0, next_time - time.monotonic()))
+                counters, now = self.read_counters(), time.monotonic()
+                elapsed = now - last_time
+                sample = {"packets": counters[0] - last[0],
+                          "bytes": counters[1] - last[1],
+                          "pps": round((counters[0] - last[0]) / elapsed, 1),
+                          "bps": round((counters[1] - last[1]) * 8 / elapsed, 1)}
+                last, last_time = counters, now
+                with self.new_sample:
+                    self.samples.append(sample)
+                    self.sample_count += 1
+                    self.new_sample.notify_all()
+                if now >= next_scan:
+                    next_scan = now + SCAN_PERIOD
+                    self.capinfos.update()
+        except OSError:
+            pass
+
+    def get_samples(self, since, timeout=None):
+        """
+            Get the samples taken after the since-th one, waiting for
+            a new sample up to timeout seconds if there is none.
+
+            :return: tuple (number of samples taken, list of samples)
+        """
+        with self.new_sample:
+            if self.sample_count <= since and timeout:
+                self.new_sample.wait(timeout)
+            new = min(self.sample_count - since, len(self.samples))
+            return self.sample_count, list(self.samples)[len(self.samples) - new:] if new > 0 else []
+
     def get_capture_stats(self):
         """
-            Get some dirty capture statistics in order to have a sparkline 
-            in the background of capture view.
+            Get some capture statistics in order to have a sparkline 
+            in the background of capture view, from the samples.
 
             :return: dict containing stats associated to the capture
         """
-        with open("/sys/class/net/{}/statistics/tx_packets".format(self.iface)) as f:
-            tx_pkts = int(f.read())
-        with open("/sys/class/net/{}/statistics/rx_packets".format(self.iface)) as f:
-            rx_pkts = int(f.read())
+        with self.new_sample:
+            samples = list(self.samples)
+        return {"status": True,
+                "packets": self.beautify_stats([s["packets"] for s in samples]),
+                "bytes": self.beautify_stats([s["bytes"] for s in samples]),
+                "pps": samples[-1]["pps"] if samples else 0,
+                "bps": samples[-1]["bps"] if samples else 0}
+
+    def read_counters(self):
+        """
+            Read the number of packets and bytes sent and received
+            by the interface of the capture.
 
-        if self.last_pkts == 0:
-            self.last_pkts = tx_pkts + rx_pkts
-            return {"status": True,
-                    "packets": [0*400]}
-        else:
-            curr_pkts = (tx_pkts + rx_pkts) - self.last_pkts
-            self.last_pkts = tx_pkts + rx_pkts
-            self.list_pkts.append(curr_pkts)
-            return {"status": True,
-                    "packets": self.beautify_stats(self.list_pkts)}
+            :return: tuple (packets, bytes)
+        """
+        counters = []
+        for name in ["tx_packets", "rx_packets", "tx_bytes", "rx_bytes"]:
+            with open("/sys/class/net/{}/statistics/{}".format(self.iface, name)) as f:
+                counters.append(int(f.read()))
+        return counters[0] + counters[1], counters[2] + counters[3]
 
     @staticmethod
     def beautify_stats(data):
         """
-            Add 0 at the end of the array if the len of the array is less 
-            than max_len. Else, get the last 100 stats. This allows to 
-            show a kind of "progressive chart" in the background for 
-            the first packets.
+            Add 1 at the end of the array if the len of the array is less 
+            than max_len. This allows to show a kind of "progressive
+            chart" in the background for the first packets.
 
             :return: a list of integers.
         """
-        max_len = 400
+        max_len = SAMPLES
         if len(data) >= max_len:
             return data[-max_len:]
         else:
@@ -99,6 +165,7 @@ class Capture(object):
             Stop tshark if any instance present & ask create_capinfos.
             :return: dict as a small confirmation.
         """
+        self.capturing = False
         if terminate_process("tshark"):
             self.create_capinfos()
             return {"status": True,
@@ -109,20 +176,16 @@ class Capture(object):
 
     def create_capinfos(self):
         """
-            Creates a capinfo json file.
+            Creates a capinfo json file, once tshark has written the
+            end of the capture. Only the end of the capture file is
+            scanned, the rest was scanned during the capture.
             :return: dict as a small confirmation.
         """
-        infos = sp.Popen(["capinfos", self.pcap],
-                         stdout=sp.PIPE, stderr=sp.PIPE)
-        infos = infos.communicate()[0]
-        data = {}
-        for l in infos.decode().splitlines():
-            try:
-                l = l.split(": ") if ": " in l else l.split("= ")
-                if len(l[0]) and len(l[1]):
-                    data[l[0].strip()] = l[1].strip()
-            except:
-                continue
+        try:
+            self.tshark.wait(timeout=10)
+        except:
+            pass
+        self.capinfos.update(final=True)
         with open("{}capinfos.json".format(self.assets_dir), 'w') as f:
-            json.dump(data, f)
+            json.dump(self.capinfos.get_infos(), f)
             return True
@@ -1,71 +1,245 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import threading
 import pyudev
 import psutil
 import shutil
+import zipfile
+import select
 import re
-import io
+import os
 from os import mkdir
 from datetime import datetime
-from flask import jsonify, send_file
+from flask import jsonify, Response, stream_with_context
+
+CHUNK_SIZE = 256 * 1024
+# Files already compressed (or not worth it), stored as is in the ZIP.
+STORED = (".pcap", ".pcapng", ".gz", ".zip", ".pdf", ".png")
+# Space kept free on the USB key in addition of the capture size.
+ZIP_MARGIN = 1024 * 1024
+
+
+class ZipBuffer(object):
+    """
+        Unseekable file object receiving the ZIP being written,
+        drained by chunks to stream it.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
 
 
 class Save():
 
     def __init__(self):
         self.mount_point = ""
+        self.progress = {}
+        self.usb = None
+        self.monitor = None
         return None
 
     def usb_check(self):
         """
-            Check if an USB storage is connected or not.
+            Check if an USB storage is connected or not, from the state
+            kept by the udev monitor.
             :return: a json containing the connection status.
         """
-        self.usb_devices = []
-        context = pyudev.Context()
-        removable = [device for device in context.list_devices(
-            subsystem='block', DEVTYPE='disk')]
-        for device in removable:
+        if self.start_monitor():
+            usb = self.usb
+        else:
+            usb = self.scan_usb()
+        if usb is not None:
+            # The free space changes without udev event (e.g. a saved capture).
+            try:
+                usb["free"] = shutil.disk_usage(usb["mount_point"]).free
+            except:
+                pass
+            return jsonify({"status": True,
+                            "message": "USB storage connected",
+                            "device": usb["device"],
+                            "mount_point": usb["mount_point"],
+                            "free": usb["free"]})
+        return jsonify({"status": False,
+                        "message": "USB storage not connected"})
+
+    def scan_usb(self, context=None):
+        """
+            Look for a mounted USB storage and update the state.
+            :return: dict - device, mount point and free space, or None.
+        """
+        context = context or pyudev.Context()
+        mounts = {p.device: p.mountpoint for p in psutil.disk_partitions()}
+        for device in context.list_devices(subsystem='block', DEVTYPE='disk'):
             if "usb" in device.sys_path:
-                partitions = [device.device_node for device in context.list_devices(
+                nodes = [device.device_node] + [p.device_node for p in context.list_devices(
                     subsystem='block', DEVTYPE='partition', parent=device)]
-                for p in psutil.disk_partitions():
-                    if p.device in partitions:
-                        self.mount_point = p.mountpoint
-                        return jsonify({"status": True,
-                                        "message": "USB storage connected"})
+                for node in nodes:
+                    if node in mounts:
+                        self.usb = {"device": node,
+                                    "mount_point": mounts[node],
+                                    "free": shutil.disk_usage(mounts[node]).free}
+                        self.mount_point = mounts[node]
+                        return self.usb
+        self.usb = None
         self.mount_point = ""
-        return jsonify({"status": False,
-                        "message": "USB storage not connected"})
+        return None
+
+    def monitor_usb(self, context, monitor):
+        """
+            Update the USB storage state when a block device comes or
+            goes (udev) and when a filesystem is (un)mounted, as the
+            key is mounted after its udev event.
+        """
+        poller = select.poll()
+        poller.register(monitor.fileno(), select.POLLIN)
+        with open("/proc/self/mounts", "r") as mounts:
+            poller.register(mounts.fileno(), select.POLLPRI | select.POLLERR)
+            while True:
+                for fd, _ in poller.poll():
+                    if fd == monitor.fileno():
+                        while monitor.poll(timeout=0) is not None:
+                            pass
+                    else:
+                        mounts.seek(0)
+                        mounts.read()
+                try:
+                    self.scan_usb(context)
+                except:
+                    pass
+
+    def start_monitor(self):
+        """
+            Start the udev monitor, if not running.
+            :return: bool - False if udev can't be monitored.
+        """
+        if self.monitor is None or not self.monitor.is_alive():
+            try:
+                context = pyudev.Context()
+                monitor = pyudev.Monitor.from_netlink(context)
+                monitor.filter_by(subsystem="block")
+                monitor.start()
+            except:
+                return False
+            self.monitor = threading.Thread(target=self.monitor_usb,
+                                            args=(context, monitor), daemon=True)
+            self.monitor.start()
+            # Events are only received from now, read the current state.
+            self.scan_usb(context)
+        return True
 
     def save_capture(self, token, method):
         """
             Save the capture to the USB device or push a ZIP
-            file to download.
+            file to download. In both cases the ZIP is written
+            by chunks, without building it in memory or in /tmp.
             :return: binary or json.
         """
-        if re.match(r"[A-F0-9]{8}", token):
+        if re.match(r"[A-F0-9]{8}", token) and os.path.isdir("/tmp/{}/".format(token)):
             try:
+                cd = datetime.now().strftime("%d%m%Y-%H%M")
                 if method == "usb":
-                    cd = datetime.now().strftime("%d%m%Y-%H%M")
-                    if shutil.make_archive("{}/TinyCheck_{}".format(self.mount_point, cd), "zip", "/tmp/{}/".format(token)):
-                        shutil.rmtree("/tmp/{}/".format(token))
-                        return jsonify({"status": True,
-                                        "message": "Capture saved on the USB key"})
+                    size = sum(os.path.getsize(p) for p, _ in self.capture_files(token))
+                    if not self.mount_point:
+                        return jsonify({"status": False,
+                                        "message": "USB storage not connected"})
+                    if shutil.disk_usage(self.mount_point).free < size + ZIP_MARGIN:
+                        return jsonify({"status": False,
+                                        "message": "Not enough space on the USB key"})
+                    try:
+                        with open("{}/TinyCheck_{}.zip".format(self.mount_point, cd), "wb") as f:
+                            for _ in self.write_zip(token, f):
+                                pass
+                            f.flush()
+                            os.fsync(f.fileno())
+                    finally:
+                        self.progress.pop(token, None)
+                    shutil.rmtree("/tmp/{}/".format(token))
+                    return jsonify({"status": True,
+                                    "message": "Capture saved on the USB key"})
                 elif method == "url":
-                    cd = datetime.now().strftime("%d%m%Y-%H%M")
-                    if shutil.make_archive("/tmp/TinyCheck_{}".format(cd), "zip", "/tmp/{}/".format(token)):
-                        shutil.rmtree("/tmp/{}/".format(token))
-                        with open("/tmp/TinyCheck_{}.zip".format(cd), "rb") as f:
-                            return send_file(
-                                io.BytesIO(f.read()),
-                                mimetype="application/octet-stream",
-                                as_attachment=True,
-                                attachment_filename="TinyCheck_{}.zip".format(cd))
+                    return Response(stream_with_context(self.stream_zip(token)),
+                                    mimetype="application/octet-stream",
+                                    headers={"Content-Disposition": "attachment; filename=TinyCheck_{}.zip".format(cd)})
             except:
                 return jsonify({"status": False,
                                 "message": "Error while saving capture"})
         else:
             return jsonify({"status": False,
                             "message": "Bad token value"})
+
+    def stream_zip(self, token):
+        """
+            Stream the ZIP of a capture. The capture is deleted
+            once completely sent.
+            :return: generator of the ZIP chunks.
+        """
+        buffer = ZipBuffer()
+        try:
+            for _ in self.write_zip(token, buffer):
+                data = buffer.drain()
+                if data:
+                    yield data
+            shutil.rmtree("/tmp/{}/".format(token))
+        finally:
+            # Also when the client goes away.
+            self.progress.pop(token, None)
+
+    def write_zip(self, token, f):
+        """
+            Write the ZIP of a capture directory in a file object, by
+            chunks. The capture files are stored, the others deflated.
+            The progress of the writing is kept in self.progress,
+            until the end of the saving.
+            :return: generator, iterated after each chunk.
+        """
+        files = self.capture_files(token)
+        progress = self.progress[token] = {"written": 0,
+                                           "total": sum(os.path.getsize(p) for p, _ in files)}
+        with zipfile.ZipFile(f, "w") as zf:
+            for path, arcname in files:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.compress_type = zipfile.ZIP_STORED if path.endswith(STORED) \
+                    else zipfile.ZIP_DEFLATED
+                with open(path, "rb") as src, zf.open(info, "w") as dst:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                        dst.write(chunk)
+                        progress["written"] += len(chunk)
+                        yield
+        yield
+
+    @staticmethod
+    def capture_files(token):
+        """
+            List the files of a capture directory.
+            :return: list of tuples (path, path in the ZIP)
+        """
+        capture_dir = "/tmp/{}/".format(token)
+        files = []
+        for root, dirs, names in os.walk(capture_dir):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                files.append((path, os.path.relpath(path, capture_dir)))
+        return files
+
+    def get_progress(self, token):
+        """
+            Get the progress of the saving of a capture.
+            :return: dict - bytes written and total.
+        """
+        if token in self.progress:
+            return dict(self.progress[token], status=True)
+        return {"status": False,
+                "message": "No saving in progress"}
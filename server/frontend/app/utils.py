@@ -48,3 +48,29 @@ def delete_captures():
         return True
     except:
         return False
+
+
+def serve(app, host, port, threads=1):
+    """
+        Serve the application with gunicorn, in a single worker
+        answering threads requests at a time. The capture and the
+        network state live in this worker, so the service has no
+        reload (it would replace the worker during a capture).
+    """
+    from gunicorn.app.base import BaseApplication
+
+    options = {"bind": "{}:{}".format(host, port),
+               "workers": 1,
+               "threads": threads,
+               "worker_class": "gthread",
+               "timeout": 120}
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
@@ -9,7 +9,8 @@ from app.blueprints.analysis import analysis_bp
 from app.blueprints.save import save_bp
 from app.blueprints.misc import misc_bp
 from app.blueprints.update import update_bp
-from app.utils import read_config
+from app.blueprints.events import events_bp
+from app.utils import read_config, serve
 
 app = Flask(__name__, template_folder="../../app/frontend/dist")
 
@@ -44,9 +45,14 @@ app.register_blueprint(analysis_bp, url_prefix='/api/analysis')
 app.register_blueprint(save_bp, url_prefix='/api/save')
 app.register_blueprint(misc_bp, url_prefix='/api/misc')
 app.register_blueprint(update_bp, url_prefix='/api/update')
+app.register_blueprint(events_bp, url_prefix='/api/events')
 
 if __name__ == '__main__':
-    if read_config(("frontend", "remote_access")):
-        app.run(host="0.0.0.0", port=80)
+    host = "0.0.0.0" if read_config(("frontend", "remote_access")) else "127.0.0.1"
+
+    if read_config(("frontend", "server")) == "gunicorn":
+        # A single worker: the capture and the network state live in
+        # the process, the requests are spread over its threads.
+        serve(app, host, 80, threads=read_config(("frontend", "threads")) or 8)
     else:
-        app.run(port=80)
+        app.run(host=host, port=80)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import threading
+import argparse
+import requests
+import urllib3
+import json
+import time
+
+"""
+    This file load-tests a running frontend or backend server, in
+    order to compare the serving modes (gunicorn and the flask
+    development server). Clients request a URL as fast as they can
+    while, optionally, other clients keep a slow endpoint busy
+    (e.g. /api/network/wifi-connect or the database export).
+
+    Usage: loadtest.py URL [--clients 16] [--requests 2000]
+                           [--slow-url URL] [--slow-clients 4]
+                           [-H "X-Token: ..."] [-o results.json]
+"""
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def client(url, headers, count, latencies, errors):
+    """
+        Request a URL count times, recording the latencies.
+    """
+    session = requests.Session()
+    for _ in range(count):
+        t = time.perf_counter()
+        try:
+            res = session.get(url, headers=headers, verify=False, timeout=60)
+            res.content
+            if res.status_code >= 400:
+                errors.append(res.status_code)
+        except requests.RequestException as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - t)
+
+
+def slow_client(url, headers, stop):
+    """
+        Keep a slow endpoint busy until stop is set.
+    """
+    session = requests.Session()
+    while not stop.is_set():
+        try:
+            session.get(url, headers=headers, verify=False, timeout=120).content
+        except requests.RequestException:
+            time.sleep(0.1)
+
+
+def percentile(values, p):
+    """
+        Get the p-th percentile of a list of values.
+        :return: float
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test a TinyCheck server.")
+    parser.add_argument("url", help="URL requested by the clients")
+    parser.add_argument("--clients", type=int, default=16,
+                        help="concurrent clients (default: 16)")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="total number of requests (default: 2000)")
+    parser.add_argument("--slow-url", help="slow URL kept busy during the test")
+    parser.add_argument("--slow-clients", type=int, default=4,
+                        help="concurrent clients of the slow URL (default: 4)")
+    parser.add_argument("-H", "--header", action="append", default=[],
+                        help="request header, e.g. \"X-Token: ...\"")
+    parser.add_argument("-o", "--output", default="loadtest.json",
+                        help="results file (default: loadtest.json)")
+    args = parser.parse_args()
+
+    headers = dict(h.split(": ", 1) for h in args.header)
+    latencies, errors = [], []
+    stop = threading.Event()
+
+    slow = []
+    if args.slow_url:
+        slow = [threading.Thread(target=slow_client, args=(args.slow_url, headers, stop), daemon=True)
+                for _ in range(args.slow_clients)]
+        for thread in slow:
+            thread.start()
+        time.sleep(1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        for i in range(args.clients):
+            count = args.requests // args.clients + (i < args.requests % args.clients)
+            executor.submit(client, args.url, headers, count, latencies, errors)
+    duration = time.perf_counter() - start
+    stop.set()
+
+    results = {"date": int(time.time()),
+               "url": args.url,
+               "slow_url": args.slow_url,
+               "clients": args.clients,
+               "slow_clients": len(slow),
+               "requests": len(latencies),
+               "errors": len(errors),
+               "duration": round(duration, 3),
+               "rps": round(len(latencies) / duration, 1),
+               "latency": {"median": round(statistics.median(latencies), 4),
+                           "p95": round(percentile(latencies, 95), 4),
+                           "p99": round(percentile(latencies, 99), 4),
+                           "max": round(max(latencies), 4)}}
+
+    print("{} requests in {:.2f}s: {} req/s, {} errors".format(
+        results["requests"], duration, results["rps"], results["errors"]))
+    print("latency: median {median}s, p95 {p95}s, p99 {p99}s, max {max}s".format(**results["latency"]))
+
+    with open(args.output, "w") as f:
+        f.write(json.dumps(results, indent=4, separators=(',', ': ')))
+    print("Results written in {}".format(args.output))
@@ -11,11 +11,13 @@ delete_services(){
     systemctl disable tinycheck-backend &> /dev/null
     systemctl disable tinycheck-kiosk &> /dev/null
     systemctl disable tinycheck-watchers &> /dev/null
+    systemctl disable tinycheck-renderer &> /dev/null
 
     rm /lib/systemd/system/tinycheck-frontend.service
     rm /lib/systemd/system/tinycheck-backend.service
     rm /lib/systemd/system/tinycheck-kiosk.service
     rm /lib/systemd/system/tinycheck-watchers.service
+    rm /lib/systemd/system/tinycheck-renderer.service
 }
 
 updating_config_files(){
@@ -77,10 +77,66 @@ elif [ $PWD = "/tmp/tinycheck" ]; then
         sed -i "s/free_issuers:/free_issuers:\n  - CN=R3,O=Let's Encrypt,C=US/g" /usr/share/tinycheck/config.yaml
     fi
 
+    if ! grep -q timings /usr/share/tinycheck/config.yaml; then
+        sed -i 's/analysis:/analysis:\n  timings: true/g' /usr/share/tinycheck/config.yaml
+    fi
+
+    if ! grep -q renderer_socket /usr/share/tinycheck/config.yaml; then
+        sed -i 's/analysis:/analysis:\n  renderer_socket: \/tmp\/tinycheck-renderer.sock/g' /usr/share/tinycheck/config.yaml
+    fi
+
+    if ! grep -q max_workers /usr/share/tinycheck/config.yaml; then
+        sed -i 's/watchers:/watchers:\n  interval: 21600\n  intervals: {}\n  max_workers: 4\n  retry_delay: 60/g' /usr/share/tinycheck/config.yaml
+    fi
+
+    if ! grep -q "^  server: " /usr/share/tinycheck/config.yaml; then
+        sed -i 's/backend:/backend:\n  server: gunicorn\n  workers: 2\n  threads: 4/g' /usr/share/tinycheck/config.yaml
+        sed -i 's/frontend:/frontend:\n  server: gunicorn\n  threads: 8/g' /usr/share/tinycheck/config.yaml
+    fi
+
+    if ! grep -q ExecReload /lib/systemd/system/tinycheck-backend.service; then
+        sed -i 's/^Restart=on-abort/ExecReload=\/bin\/kill -HUP $MAINPID\nRestart=on-abort/' /lib/systemd/system/tinycheck-backend.service
+        systemctl daemon-reload
+    fi
+
+    # A reload of the frontend would replace its only worker, and its capture.
+    if grep -q ExecReload /lib/systemd/system/tinycheck-frontend.service; then
+        sed -i '/^ExecReload/d' /lib/systemd/system/tinycheck-frontend.service
+        systemctl daemon-reload
+    fi
+
+    if ! grep -q smtp_server /usr/share/tinycheck/config.yaml; then
+        sed -n '/^report:/,/^$/p' /tmp/tinycheck/config.yaml >> /usr/share/tinycheck/config.yaml
+    fi
+
+    if ! grep -q failed_retention /usr/share/tinycheck/config.yaml; then
+        sed -i 's/^report:/report:\n  failed_retention: 604800/g' /usr/share/tinycheck/config.yaml
+    fi
+
+    if [ ! -f /lib/systemd/system/tinycheck-renderer.service ]; then
+        echo "[+] Creating the renderer service"
+        cat >/lib/systemd/system/tinycheck-renderer.service <<EOL
+[Unit]
+Description=Tarkash report renderer service
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 /usr/share/tinycheck/analysis/renderer.py
+Restart=on-failure
+KillMode=process
+
+[Install]
+WantedBy=multi-user.target
+EOL
+        systemctl daemon-reload
+        systemctl enable tinycheck-renderer &> /dev/null
+    fi
+
     echo "[+] Restarting services"
     service tinycheck-backend restart
     service tinycheck-frontend restart
     service tinycheck-watchers restart
+    service tinycheck-renderer restart
 
     echo "[+] Updating the Tarkash version"
     cd /tmp/tinycheck && git tag | tail -n 1 | xargs echo -n > /usr/share/tinycheck/VERSION